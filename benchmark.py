@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import profiler
+from corpus_gen import generate
+from dependency_gen import dep_analysis, verify_data, write_nodes, write_edges, max_workers, executors
+from src_analyzer import readers
+
+default_sizes = [1000, 10000, 100000]
+default_tolerance = 0.25
+# phases faster than this are too noisy to be compared against the baseline
+min_compared_seconds = 0.05
+work_dir = os.path.join(tempfile.gettempdir(), 'dependency-graph-bench')
+
+
+def measure(corpus, jobs=max_workers, executor='process', reader='text', render=False):
+    """
+    run the whole pipeline on corpus without the parse cache and return the profiler report with throughputs
+    """
+    profile = profiler.enable()
+    with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        with profiler.phase('total'):
+            nodes, edges = dep_analysis([corpus], jobs, executor, None, reader, excludes=[])
+            with profiler.phase('verify'):
+                verify_data(nodes, edges)
+            with profiler.phase('write'):
+                write_nodes(nodes, os.path.join(output_dir, 'nodes.txt'))
+                write_edges(edges, os.path.join(output_dir, 'edges.txt'))
+            if render:
+                from dependency_vis import create_graphviz
+                with profiler.phase('render'):
+                    create_graphviz(edges, os.path.join(output_dir, 'graph'))
+    profiler.disable()
+    report = profile.report()
+    parse_seconds = report['phases']['parse']
+    report['files_per_second'] = report['counters']['files_parsed'] / parse_seconds
+    report['mb_per_second'] = report['counters']['bytes_read'] / parse_seconds / 1e6
+    return report
+
+
+def run(size, seed, jobs, executor, reader, render):
+    """
+    generate the corpus of size files once and measure it in a fresh interpreter, so that the peak RSS is its own
+    """
+    corpus = os.path.join(work_dir, f'corpus-{size}-{seed}')
+    if not os.path.exists(os.path.join(corpus, '.complete')):
+        print(f'Generating {size} files in {corpus}')
+        generate(corpus, files=size, seed=seed)
+        open(os.path.join(corpus, '.complete'), 'w').close()
+    command = [sys.executable, __file__, '--measure', corpus, '-j', str(jobs), '--executor', executor,
+               '--reader', reader] + (['--render'] if render else [])
+    return json.loads(subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout)
+
+
+def compare(results, baseline, tolerance=default_tolerance):
+    """
+    return the list of regressions: phases, or the peak RSS, slower or bigger than the baseline by more than tolerance
+    """
+    regressions = []
+    for size, report in results.items():
+        base = baseline.get(size)
+        if base is None:
+            continue
+        for phase, seconds in report['phases'].items():
+            old = base['phases'].get(phase)
+            if old is not None and max(old, seconds) >= min_compared_seconds and seconds > old * (1 + tolerance):
+                regressions.append(f'{size} files: {phase} took {seconds:.3f}s, baseline {old:.3f}s')
+        rss, old = report.get('peak_rss', dict()).get('self'), base.get('peak_rss', dict()).get('self')
+        if rss and old and rss > old * (1 + tolerance):
+            regressions.append(f'{size} files: peak RSS {rss}, baseline {old}')
+    return regressions
+
+
+def summary(size, report):
+    phases = ' '.join(f'{p}={s:.3f}s' for p, s in report['phases'].items())
+    rss = report.get('peak_rss', dict()).get('self', '?')
+    return (f'{size} files: {report["files_per_second"]:.0f} files/s {report["mb_per_second"]:.2f} MB/s '
+            f'peak RSS {rss} | {phases}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time every phase of the pipeline on synthetic C++ trees')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='Numbers of files to benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated trees')
+    parser.add_argument('-j', '--jobs', type=int, default=max_workers, help='Number of parallel parsing workers')
+    parser.add_argument('--executor', choices=executors, default='process', help='Parallel backend used for parsing')
+    parser.add_argument('--reader', choices=readers, default='text', help='How source files are read')
+    parser.add_argument('--render', action='store_true', help='Include graph rendering, which needs graphviz')
+    parser.add_argument('--save', metavar='FILE', help='Write the results to FILE as JSON, to be used as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare the results against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=default_tolerance, help='Allowed slowdown before a phase is reported as a regression')
+    parser.add_argument('--measure', metavar='CORPUS', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        json.dump(measure(args.measure, args.jobs, args.executor, args.reader, args.render), sys.stdout)
+        sys.exit(0)
+
+    results = dict()
+    for size in args.sizes:
+        results[str(size)] = run(size, args.seed, args.jobs, args.executor, args.reader, args.render)
+        print(summary(size, results[str(size)]))
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump(results, fd, indent=2)
+            fd.write('\n')
+        print(f'Saved results to {args.save}')
+    if args.baseline:
+        with open(args.baseline, 'r') as fd:
+            regressions = compare(results, json.load(fd), args.tolerance)
+        for r in regressions:
+            print(f'Regression: {r}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regression against the baseline')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+
+files_per_dir = 100
+
+
+def header_path(i):
+    return f'dir_{i // files_per_dir}/m{i}.h'
+
+
+def type_name(i, k):
+    return f'C{i}_{k}'
+
+
+def class_block(rng, name, deps, base, members, nesting, indent):
+    """
+    return the lines of a class named name deriving from base, with fields and methods referencing deps and nesting
+    levels of nested structs
+    """
+    pad = '    ' * indent
+    inheritance = f' : public {base}' if base else ''
+    lines = [f'{pad}class {name}{inheritance} {{', f'{pad}public:']
+    for m in range(members):
+        dep = rng.choice(deps) if deps else 'int'
+        if m % 3 == 0:
+            lines.append(f'{pad}    {dep} field{m};')
+        elif m % 3 == 1:
+            lines.append(f'{pad}    void method{m}(const {dep}& arg);')
+        else:
+            lines.append(f'{pad}    int inline{m}() {{ {dep}* p = nullptr; return p ? 1 : 0; }}')
+    if nesting > 0:
+        lines += class_block(rng, f'{name}_N', deps, None, max(1, members // 2), nesting - 1, indent + 1)
+    lines.append(f'{pad}}};')
+    return lines
+
+
+def generate(out_dir, files=1000, depth=8, fanout=3, classes=2, members=6, nesting=1, templates=0.1, cycles=0, seed=0):
+    """
+    write a synthetic C++ tree of files headers and sources under out_dir, files_per_dir per directory.
+    headers are split into depth layers, each including fanout headers of the layer below and declaring classes
+    types whose fields, methods and bases refer to the included types. cycles back includes from lower layers close
+    include cycles, a fraction templates of the types is a class template. every source includes its header.
+    the same arguments always produce the same tree
+    """
+    rng = random.Random(seed)
+    headers = max(1, files // 2)
+    sources = files - headers
+    # layer l holds the headers in [starts[l], starts[l + 1]) and includes headers of layer l - 1
+    starts = [layer * headers // depth for layer in range(depth + 1)]
+    layers = [layer for layer in range(depth) for _ in range(starts[layer], starts[layer + 1])]
+    includes = []
+    for i in range(headers):
+        layer = layers[i]
+        lower = range(starts[layer - 1], starts[layer]) if layer > 0 else range(0)
+        includes.append(rng.sample(lower, min(fanout, len(lower))))
+    for _ in range(cycles):
+        # a header included by j including j back closes a cycle
+        j = rng.randrange(headers)
+        if includes[j]:
+            includes[rng.choice(includes[j])].append(j)
+
+    for i in range(headers):
+        deps = [type_name(j, k) for j in includes[i] if j < i for k in range(classes)]
+        lines = ['#pragma once', '']
+        lines += [f'#include "{header_path(j)}"' for j in includes[i]]
+        lines += ['#include <vector>', '', 'namespace bench {', '']
+        for k in range(classes):
+            if rng.random() < templates:
+                lines.append('template <typename T, int N = 4>')
+            base = rng.choice(deps) if deps and rng.random() < 0.5 else None
+            lines += class_block(rng, type_name(i, k), deps, base, members, nesting, 0)
+            lines.append('')
+        lines.append('}  // namespace bench')
+        write(out_dir, header_path(i), lines)
+
+    for i in range(sources):
+        own = [type_name(i, k) for k in range(classes)]
+        lines = [f'#include "{header_path(i)}"', '', 'namespace bench {', '']
+        lines += [f'// definitions of {name}' for name in own]
+        lines += class_block(rng, f'S{i}', own, None, members // 2 + 1, 0, 0)
+        lines += ['', '}  // namespace bench']
+        write(out_dir, header_path(i)[:-2] + '.cpp', lines)
+
+
+def write(out_dir, path, lines):
+    file = os.path.join(out_dir, path)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'w') as fd:
+        fd.write('\n'.join(lines))
+        fd.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic C++ source tree for benchmarks')
+    parser.add_argument('output', help='Directory to write the tree into')
+    parser.add_argument('--files', type=int, default=1000, help='Number of files, half headers and half sources')
+    parser.add_argument('--depth', type=int, default=8, help='Number of include layers')
+    parser.add_argument('--fanout', type=int, default=3, help='Number of headers each header includes')
+    parser.add_argument('--classes', type=int, default=2, help='Number of types declared per header')
+    parser.add_argument('--members', type=int, default=6, help='Number of fields and methods per type')
+    parser.add_argument('--nesting', type=int, default=1, help='Levels of nested types')
+    parser.add_argument('--templates', type=float, default=0.1, help='Fraction of the types that are templates')
+    parser.add_argument('--cycles', type=int, default=0, help='Number of back includes closing include cycles')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    generate(args.output, args.files, args.depth, args.fanout, args.classes, args.members, args.nesting,
+             args.templates, args.cycles, args.seed)
+    print(f'Generated {args.files} files in {args.output}')
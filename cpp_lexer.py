@@ -0,0 +1,115 @@
+"""
+single pass C++ lexer.
+One master regex walks the raw code once and yields include directives, forward declarations, type declarations and
+braces, skipping comments, string literals and templates. Class bodies are sliced from the code with comments,
+strings and templates blanked out, which is the only copy of the file made besides the raw text.
+"""
+import re
+
+fwd_decl_regex = r'(?<!friend)\s+(class|struct|enum(?: class)?) +([_a-zA-Z][_a-zA-Z0-9]*)\s*;'
+type_declare_regex = r'(class|struct|enum(?: class)?) +([_a-zA-Z][_a-zA-Z0-9]*)\s*(:[^{;]+)?\{'
+template_regex = r'template\s*<[^>]*>'
+
+token_regex = '|'.join([
+    r'(?P<include>#[ \t]*include\s*["<](?P<header>[^">\n]*)[">])',
+    r'(?P<comment>//[^\n]*|/\*.*?(?:\*/|$))',
+    r'(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')',
+    rf'(?P<template>{template_regex})',
+    rf'(?P<fwd>{fwd_decl_regex})',
+    rf'(?P<declare>{type_declare_regex})',
+    r'(?P<brace>[{}])',
+])
+token_pattern = re.compile(token_regex, re.DOTALL)
+# comments and templates may hide in the inheritance clause that a declaration token spans
+clause_noise_regex = rf'//[^\n]*|/\*.*?(?:\*/|$)|{template_regex}'
+clause_noise_pattern = re.compile(clause_noise_regex, re.DOTALL)
+
+# the same patterns compiled for bytes, to scan memory mapped files without decoding them
+bytes_token_pattern = re.compile(token_regex.encode(), re.DOTALL)
+bytes_clause_noise_pattern = re.compile(clause_noise_regex.encode(), re.DOTALL)
+fwd_group = token_pattern.groupindex['fwd']
+declare_group = token_pattern.groupindex['declare']
+
+
+class TypeDeclare:
+    def __init__(self, classifier, name, inheritance_declare, body_start) -> None:
+        # str or bytes, following the scanned code
+        self.classifier = classifier
+        self.name = name
+        self.inheritance_declare = inheritance_declare
+        # offsets into the cleaned code
+        self.body_start = body_start
+        self.body_end = None
+
+
+def tokenize(code, pattern=token_pattern):
+    """
+    stream (kind, match) over the raw code, kind being the name of the matching group of token_pattern
+    """
+    for m in pattern.finditer(code):
+        yield m.lastgroup, m
+
+
+def scan(code):
+    """
+    return a tuple of
+     cleaned: the code with comments and templates removed and string literals emptied
+     includes: list of included paths
+     fwd_decls: list of (classifier, name) tuples
+     declares: list of TypeDeclare ordered by declaration, body span given by offsets into cleaned
+    code may be str, or bytes-like such as a mmap in which case everything returned is bytes.
+    """
+    if isinstance(code, str):
+        pattern, noise, space, empty, open_brace, block_comment = token_pattern, clause_noise_pattern, ' ', '', '{', '/*'
+    else:
+        pattern, noise, space, empty, open_brace, block_comment = bytes_token_pattern, bytes_clause_noise_pattern, b' ', b'', b'{', b'/*'
+    pieces = []
+    size = 0
+    last = 0
+    includes = []
+    fwd_decls = []
+    declares = []
+    stack = []
+    for kind, m in tokenize(code, pattern):
+        gap = code[last:m.start()]
+        pieces.append(gap)
+        size += len(gap)
+        last = m.end()
+        if kind == 'comment' or kind == 'template':
+            # keep a separator so that tokens on both sides stay apart
+            token = space if kind == 'template' or m.group().startswith(block_comment) else empty
+        elif kind == 'string':
+            token = m.group()[:1] * 2
+        else:
+            token = m.group()
+
+        if kind == 'include':
+            includes.append(m.group('header'))
+        elif kind == 'fwd':
+            fwd_decls.append(m.group(fwd_group + 1, fwd_group + 2))
+        elif kind == 'declare':
+            t, n, d = m.group(declare_group + 1, declare_group + 2, declare_group + 3)
+            if d:
+                d = noise.sub(space, d)
+            declare = TypeDeclare(t, n, d, size + len(token))
+            declares.append(declare)
+            stack.append(declare)
+        elif kind == 'brace':
+            if token == open_brace:
+                stack.append(None)
+            elif stack:
+                declare = stack.pop()
+                if declare is not None:
+                    declare.body_end = size + 1
+
+        pieces.append(token)
+        size += len(token)
+    pieces.append(code[last:])
+    cleaned = empty.join(pieces)
+
+    # an unclosed body runs to the end of the code, dropping its last character
+    unclosed_end = len(cleaned.rstrip()) - 1
+    for declare in declares:
+        if declare.body_end is None:
+            declare.body_end = unclosed_end
+    return cleaned, includes, fwd_decls, declares
@@ -2,6 +2,8 @@ import json
 import os
 import re
 import sys
+from array import array
+from collections.abc import Mapping
 from enum import Enum
 
 
@@ -17,9 +19,7 @@ class SourceType(Enum):
 
     @staticmethod
     def parseval(symbol):
-        for item in list(SourceType):
-            if re.fullmatch(item.value, symbol):
-                return item
+        return source_types.get(symbol)
 
 
 class TypeClassifier(Enum):
@@ -29,19 +29,31 @@ class TypeClassifier(Enum):
 
     @staticmethod
     def parseval(symbol):
-        for item in list(TypeClassifier):
-            if re.fullmatch(item.value, symbol):
-                return item
+        return type_classifiers.get(symbol)
+
+
+# literal lookups equivalent to a fullmatch against the enum patterns
+source_types = {'.h': SourceType.HEADER, '.hpp': SourceType.HEADER,
+                '.c': SourceType.SOURCE, '.cc': SourceType.SOURCE, '.cpp': SourceType.SOURCE, '.c++': SourceType.SOURCE}
+type_classifiers = {'enum': TypeClassifier.ENUM, 'enum class': TypeClassifier.ENUM,
+                    'struct': TypeClassifier.STRUCT, 'class': TypeClassifier.CLASS}
 
 
 class SourceNode:
+    __slots__ = ('srcFile', 'sourceName', 'sourceType', '_hash')
+
     def __init__(self, srcFile) -> None:
         self.srcFile = srcFile
         self.sourceName, ext = os.path.splitext(os.path.basename(srcFile))
         self.sourceType = SourceType.parseval(ext)
+        self._hash = hash(srcFile)
+
+    def __reduce__(self):
+        # the cached hash depends on the hash seed of the process, rebuild it when unpickling
+        return SourceNode, (self.srcFile,)
 
     def __hash__(self) -> int:
-        return hash(self.srcFile)
+        return self._hash
 
     def __eq__(self, other):
         if not isinstance(other, SourceNode):
@@ -57,20 +69,26 @@ class SourceNode:
 
 
 class SymbolNode:
+    __slots__ = ('name', 'source', 'classifier', '_hash')
+
     def __init__(self, name, classifier, source: SourceNode) -> None:
         # class name
-        self.name = name
+        self.name = sys.intern(name)
 
         self.source = source
         if isinstance(classifier, TypeClassifier):
             self.classifier = classifier
-        elif isinstance(classifier, str):
+        else:
             self.classifier = TypeClassifier.parseval(classifier)
         if self.classifier is None:
             print(f'"{classifier}" is not a proper TypeClassifier', file=sys.stderr)
+        self._hash = hash((self.name, source, self.classifier))
+
+    def __reduce__(self):
+        return SymbolNode, (self.name, self.classifier, self.source)
 
     def __hash__(self) -> int:
-        return hash(self.name) ^ hash(self.source) ^ hash(self.classifier)
+        return self._hash
 
     def __eq__(self, other):
         if not isinstance(other, SymbolNode):
@@ -85,32 +103,43 @@ class SymbolNode:
 
 
 class CodeNode:
-    def __init__(self, class_body=None, inheritance_declare=None) -> None:
-        self.class_body = class_body
-        self.inheritance_declare = inheritance_declare
+    """
+    summary of a type declaration: the identifiers of its field-like statements, of its method-like statements (those
+    containing parentheses) and of its inheritance clause. the body text itself is dropped once summarized.
+    """
+    __slots__ = ('field_names', 'method_names', 'inheritance_names')
+
+    def __init__(self, field_names=frozenset(), method_names=frozenset(), inheritance_names=frozenset()) -> None:
+        self.field_names = frozenset(field_names)
+        self.method_names = frozenset(method_names)
+        self.inheritance_names = frozenset(inheritance_names)
 
     def __hash__(self) -> int:
-        return hash(self.class_body) ^ hash(self.inheritance_declare)
+        return hash((self.field_names, self.method_names, self.inheritance_names))
 
     def __eq__(self, other):
         if not isinstance(other, CodeNode):
             return False
 
-        return (self.class_body == other.class_body
-                and self.inheritance_declare == other.inheritance_declare)
+        return (self.field_names == other.field_names
+                and self.method_names == other.method_names
+                and self.inheritance_names == other.inheritance_names)
 
     def __repr__(self) -> str:
-        return self.class_body
+        return f'fields={sorted(self.field_names)} methods={sorted(self.method_names)} ' \
+               f'inheritance={sorted(self.inheritance_names)}'
+
+
+def symbol_record(node):
+    return {"name": node.name, "classifier": node.classifier.name, "source": node.source.srcFile}
 
 
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, SymbolNode):
-            return {"name": obj.name, "classifier": obj.classifier.name, "source": obj.source.srcFile}
+            return symbol_record(obj)
         if isinstance(obj, EdgeNode):
-            caller = json.loads(json.dumps(obj.caller, cls=CustomEncoder))
-            callee = json.loads(json.dumps(obj.callee, cls=CustomEncoder))
-            return {"caller": caller, "callee": callee, "refType": obj.refType.name}
+            return {"caller": symbol_record(obj.caller), "callee": symbol_record(obj.callee), "refType": obj.refType.name}
 
         return json.JSONEncoder.default(self, obj)
 
@@ -128,26 +157,126 @@ class TypeDependencyDecoder(json.JSONDecoder):
 
 
 class EdgeNode:
+    __slots__ = ('caller', 'callee', 'refType', '_hash')
+
     def __init__(self, caller: SymbolNode, callee: SymbolNode, refType: RefType) -> None:
         self.callee = callee
         self.caller = caller
         self.refType = refType
+        self._hash = hash((caller, callee, refType))
+
+    def __reduce__(self):
+        return EdgeNode, (self.caller, self.callee, self.refType)
 
     def __hash__(self) -> int:
-        return hash(self.caller) ^ hash(self.callee) ^ hash(self.refType)
+        return self._hash
 
     def __eq__(self, other):
-        if not isinstance(other, SymbolNode):
+        if not isinstance(other, EdgeNode):
             return False
 
-        return (self.caller == other.source
-                and self.callee == other.source
-                and self.refType == other.name)
+        return (self.caller == other.caller
+                and self.callee == other.callee
+                and self.refType == other.refType)
 
     def __str__(self) -> str:
         return f'{self.caller} -> {self.callee}'
 
 
+class SymbolTable:
+    """
+    interns symbols to consecutive integer ids so that sets of symbols can be kept as bitsets and edges as arrays
+    """
+    __slots__ = ('symbols', 'ids')
+
+    def __init__(self) -> None:
+        self.symbols = []
+        self.ids = dict()
+
+    def intern(self, symbol) -> int:
+        i = self.ids.get(symbol)
+        if i is None:
+            i = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return i
+
+    def bits(self, symbols) -> int:
+        bits = 0
+        for s in symbols:
+            bits |= 1 << self.intern(s)
+        return bits
+
+    def decode(self, bits) -> set:
+        return {self.symbols[i] for i, b in enumerate(reversed(bin(bits)[2:])) if b == '1'}
+
+
+class EdgeStore:
+    """
+    deduplicated edges kept as parallel arrays of (caller id, callee id, refType value) over a SymbolTable.
+    iterating yields EdgeNode views
+    """
+    __slots__ = ('table', 'callers', 'callees', 'refTypes', 'keys')
+
+    def __init__(self, table: SymbolTable = None) -> None:
+        self.table = table or SymbolTable()
+        self.callers = array('l')
+        self.callees = array('l')
+        self.refTypes = array('b')
+        # (caller id, callee id, refType value) packed into one int
+        self.keys = set()
+
+    def add(self, caller: SymbolNode, callee: SymbolNode, refType: RefType):
+        caller_id = self.table.intern(caller)
+        callee_id = self.table.intern(callee)
+        key = (caller_id << 34) | (callee_id << 2) | refType.value
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        self.callers.append(caller_id)
+        self.callees.append(callee_id)
+        self.refTypes.append(refType.value)
+
+    def __contains__(self, edge):
+        if not isinstance(edge, EdgeNode):
+            return False
+        caller_id = self.table.ids.get(edge.caller)
+        callee_id = self.table.ids.get(edge.callee)
+        if caller_id is None or callee_id is None:
+            return False
+        return ((caller_id << 34) | (callee_id << 2) | edge.refType.value) in self.keys
+
+    def __iter__(self):
+        symbols = self.table.symbols
+        for caller_id, callee_id, refType in zip(self.callers, self.callees, self.refTypes):
+            yield EdgeNode(symbols[caller_id], symbols[callee_id], RefType(refType))
+
+    def __len__(self):
+        return len(self.callers)
+
+
+class ClosureMap(Mapping):
+    """
+    read-only {src: set(SymbolNode)} backed by one int bitset per src.
+    sets are materialized only for the srcs that are looked up
+    """
+
+    def __init__(self, table: SymbolTable, bits: dict) -> None:
+        self.table = table
+        self.bits = bits
+
+    def __getitem__(self, src):
+        return self.table.decode(self.bits[src])
+
+    def __contains__(self, src):
+        return src in self.bits
+
+    def __iter__(self):
+        return iter(self.bits)
+
+    def __len__(self):
+        return len(self.bits)
+
+
 if __name__ == '__main__':
     tc = TypeClassifier.parseval('enum class')
     print(tc)
@@ -1,28 +1,35 @@
 import argparse
-import codecs
-import json
 import os
-import queue
-import re
+import concurrent.futures
+import functools
+import logging
 import sys
-import threading
 from collections import defaultdict
-import graphlib
 from typing import Dict, Set
 
-from data_structures import SourceNode, EdgeNode, CustomEncoder, SymbolNode, RefType, CodeNode, SourceType
-from src_analyzer import src_proc
+from data_structures import SourceNode, SymbolNode, RefType, CodeNode, SourceType, SymbolTable, ClosureMap, EdgeStore
+from file_walker import walk
+from graph_io import write_node_records, write_edge_records, write_binary
+from parse_cache import ParseCache, save_include_state
+import profiler
+from path_index import PathIndex
+from src_analyzer import src_proc, readers
 
 node_file = os.path.join(os.path.dirname(__file__), "types.txt")
 edge_file = os.path.join(os.path.dirname(__file__), "type-dependencies.txt")
+binary_file = os.path.join(os.path.dirname(__file__), "graph.bin")
 
-max_queue_size = 7
-assembly_line = queue.Queue(max_queue_size)
+max_workers = os.cpu_count() or 1
+executors = ['process', 'thread', 'serial']
+parse_chunksize = 8
 
-include_regex = re.compile('#include\s+["<"](.*)[">]')
 valid_headers = [['.h', '.hpp'], 'red']
 valid_sources = [['.c', '.cc', '.cpp'], 'blue']
 valid_extensions = valid_headers[0] + valid_sources[0]
+default_excludes = ['tests']
+log_levels = ['debug', 'info', 'warning', 'error']
+
+logger = logging.getLogger(__name__)
 
 
 def normalize(path):
@@ -33,15 +40,17 @@ def normalize(path):
     return filename[:end]
 
 
-def skip(entry):
-    if '/tests/' in entry.path:
-        return True
-    if entry.is_file():
-        _, ext = os.path.splitext(entry.path)
-        if ext not in valid_extensions:
-            return True
+def has_valid_extension(path):
+    _, ext = os.path.splitext(path)
+    return ext in valid_extensions
 
-    return False
+
+def walk_code_files(paths, excludes=default_excludes, use_gitignore=True, recursive=True):
+    """
+    generate the code files under paths as the directories are scanned, pruning excluded and git-ignored directories
+    """
+    files = walk(paths, accept=has_valid_extension, excludes=excludes, use_gitignore=use_gitignore, recursive=recursive)
+    return profiler.timed('walk', files)
 
 
 def find_code_files(path, recursive=True):
@@ -49,128 +58,211 @@ def find_code_files(path, recursive=True):
     Return a list of all the files in the folder.
     If recursive is True, the function will search recursively.
     """
-    if os.path.exists(path) and os.path.isfile(path):
-        return [path]
-    files = []
-    for entry in os.scandir(path):
-        if skip(entry):
-            continue
-        if entry.is_dir() and recursive:
-            files.extend(find_code_files(entry.path))
-        else:
-            files.append(entry.path)
-    return files
+    return list(walk_code_files([path], recursive=recursive))
+
 
+def configure_logging(level):
+    logging.basicConfig(level=level, format='%(message)s')
 
-def source_proc(root_dir):
+
+def parse_file(src_file, reader='text', profile=False):
     """
-    return a tuple (includes, declares)
-    includes: dict{src_file : set(includes)}
-    declares: dict{src_file : dict{TypeNode : CodeNode}}
+    parse a single file into a picklable record (src_file, declares, includes, fwd_declares)
+    if profile is set the record carries a fifth item, the stats measured by src_proc
+    """
+    logger.debug('Processing %s', src_file)
+    stats = dict() if profile else None
+    ns, incls, fwd_decs = src_proc(src_file, reader, stats)
+    logger.debug('Finished %s', src_file)
+    if profile:
+        return src_file, ns, incls, fwd_decs, stats
+    return src_file, ns, incls, fwd_decs
+
+
+def create_executor(executor, jobs):
+    if executor == 'process':
+        # workers log at the level of the parent whatever the start method
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=configure_logging,
+                                                      initargs=(logging.getLogger().getEffectiveLevel(),))
+    if executor == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    raise ValueError(f'Unknown executor: {executor}')
+
+
+def iter_parsed(src_files, jobs=max_workers, executor='process', reader='text'):
+    """
+    generate the records (src_file, declares, includes, fwd_declares) of src_files, which may be a generator, as they
+    are parsed on the selected executor
+    """
+    profile = profiler.current
+    parse = functools.partial(parse_file, reader=reader, profile=profile is not None)
+    if executor == 'serial' or jobs <= 1:
+        print('process source files serially')
+        yield from account(map(parse, src_files), profile)
+    else:
+        print(f'process source files at capacity of {jobs} {executor} workers')
+        with create_executor(executor, jobs) as pool:
+            yield from account(pool.map(parse, src_files, chunksize=parse_chunksize), profile)
+
+
+def account(records, profile):
+    """
+    hand the stats of profiled records to profile and strip them from the records
+    """
+    if profile is None:
+        yield from records
+        return
+    for record in records:
+        profile.record_file(record[0], record[4])
+        yield record[:4]
+
+
+def parse_sources(src_files, jobs=max_workers, executor='process', reader='text'):
+    """
+    return dictionary: {src_file: (declares, includes, fwd_declares)}
     """
+    return {f: (ns, incls, fwd_decs) for f, ns, incls, fwd_decs in iter_parsed(src_files, jobs, executor, reader)}
 
-    def worker():
-        while True:
-            src_file = assembly_line.get()
-            srcNode = SourceNode(src_file)
-            print(f'Processing {src_file}')
-            ns, incls, fwd_decs = src_proc(src_file)
-            if ns:
-                declares[srcNode] = ns
-            if incls:
-                includes[srcNode] = incls
-            if fwd_decs:
-                fwd_declares[srcNode] = fwd_decs
-            print(f'Finished {src_file}')
-            assembly_line.task_done()
 
+def merge_records(src_files, results):
+    """
+    merge the per file results {src_file: (declares, includes, fwd_declares)} in the order of src_files
+    """
     includes = dict()
     declares = dict()
     fwd_declares = dict()
-    print("process source files at capacity of {} threads".format(max_queue_size))
-    ths = [threading.Thread(target=worker, daemon=True) for _ in range(max_queue_size)]
-    for t in ths:
-        t.start()
+    for src_file in src_files:
+        ns, incls, fwd_decs = results[src_file]
+        srcNode = SourceNode(src_file)
+        if ns:
+            declares[srcNode] = ns
+        if incls:
+            includes[srcNode] = incls
+        if fwd_decs:
+            fwd_declares[srcNode] = fwd_decs
+    return includes, declares, fwd_declares
 
-    for item in find_code_files(root_dir):
-        assembly_line.put(item)
-    assembly_line.join()
 
+def collect_sources(root_dirs, jobs=max_workers, executor='process', cache_dir=None, reader='text',
+                    excludes=default_excludes, use_gitignore=True):
+    """
+    return dictionary: {src_file: (declares, includes, fwd_declares)} of every code file under root_dirs
+    all root_dirs share one pool and files are handed to it as the directories are walked, so parsing starts before
+    the walk ends. if cache_dir is given, unchanged files are served from the parse cache stored there.
+    """
+    if isinstance(root_dirs, str):
+        root_dirs = [root_dirs]
+    src_files = []
+    cache = ParseCache(cache_dir) if cache_dir else None
+    cached = dict()
+
+    def misses():
+        for src_file in walk_code_files(root_dirs, excludes, use_gitignore):
+            src_files.append(src_file)
+            result = cache.lookup(src_file) if cache else None
+            if result is None:
+                yield src_file
+            else:
+                cached[src_file] = result
+
+    with profiler.phase('parse'):
+        parsed = parse_sources(misses(), jobs, executor, reader)
+
+    if cache:
+        with profiler.phase('cache'):
+            for src_file, result in parsed.items():
+                cache.store(src_file, result)
+            cache.prune(set(src_files))
+            cache.save()
+        cache.report()
+        profiler.count('cache_hits', cache.hits)
+        profiler.count('cache_misses', cache.misses)
+
+    cached.update(parsed)
     print('All work completed')
-    return includes, declares, fwd_declares
+    return cached
+
+
+def source_proc(root_dirs, jobs=max_workers, executor='process', cache_dir=None, reader='text',
+                excludes=default_excludes, use_gitignore=True):
+    """
+    return a tuple (includes, declares, fwd_declares)
+    includes: dict{src_file : set(includes)}
+    declares: dict{src_file : dict{TypeNode : CodeNode}}
+    fwd_declares: dict{src_file : set(TypeNode)}
+    results are merged in sorted file order so that the output is deterministic.
+    """
+    results = collect_sources(root_dirs, jobs, executor, cache_dir, reader, excludes, use_gitignore)
+    return merge_records(sorted(results.keys()), results)
 
 
 def write_nodes(nodes, file=node_file):
-    with open(file, "w") as fd:
-        for node in nodes:
-            json.dump(node, fd, cls=CustomEncoder)
-            fd.write('\n')
+    write_node_records(nodes, file)
     print(f'Saved nodes to {file}')
 
 
 def write_edges(edges, file=edge_file):
-    with open(file, "w") as fd:
-        for edge in edges:
-            json.dump({'caller': edge.caller.name, 'callee': edge.callee.name, 'refType': edge.refType.name}, fd)
-            fd.write('\n')
+    write_edge_records(edges, file)
     print(f'Saved edges to {file}')
 
 
-def fieldMatch(statements, name):
-    pattern = fr'\W*{name}\W*'
-    for s in statements:
-        if re.match(pattern, s) and s.find('(') < 0 and s.find(')') < 0:
-            return True
-    return False
-
+def write_binary_graph(nodes, edges, file=binary_file):
+    write_binary(nodes, edges, file)
+    print(f'Saved binary graph to {file}')
 
-def methodMatch(statements, name):
-    pattern = fr'\W*{name}\W*'
-    for s in statements:
-        if re.match(pattern, s) and s.find('(') >= 0 and s.find(')') >= 0:
-            return True
-    return False
 
+class SymbolIndex(dict):
+    """
+    {name: set(SymbolNode)} of candidate types, with the distinct lengths of the names so that the names lying within
+    an identifier are found by looking up its slices of those lengths, linear in the identifier
+    """
 
-def symbol_search(code: CodeNode, types: Set[SymbolNode]) -> Dict[SymbolNode, RefType]:
-    deps = dict()
-    if code.inheritance_declare:
+    def __init__(self, types=()) -> None:
+        super().__init__()
         for t in types:
-            if code.inheritance_declare.find(t.name) >= 0:
-                deps[t] = RefType.INHERITANCE
+            self.setdefault(t.name, set()).add(t)
+        self.lengths = sorted({len(name) for name in self})
 
-    if code.class_body:
-        for t in types:
-            pattern = fr'\b{t.name}\b'
-            statements = [s for s in code.class_body.split(';') if re.findall(pattern, s)]
-            if not statements:
-                continue
-            if all(s.find('(') < 0 and s.find(')') < 0 for s in statements):
-                deps[t] = RefType.COMPOSITION
-            else:
-                deps[t] = RefType.METHOD
+    def names_within(self, token):
+        return {token[i:i + n] for n in self.lengths for i in range(len(token) - n + 1) if token[i:i + n] in self}
 
-    return deps
 
+def symbol_index(types: Set[SymbolNode]) -> SymbolIndex:
+    """
+    group candidate types by name so that a class body can be matched against all of them in one pass
+    """
+    return SymbolIndex(types)
 
-def substitute_includes(includes, srcs: Set[SourceNode]):
-    def best_match(incl):
-        matches = [s for s in srcFiles.keys() if s.endswith(incl) and os.path.basename(s) == os.path.basename(incl)]
-        if matches:
-            if len(matches) > 1:
-                print(f'More than one src files: {matches} matches {incl}', file=sys.stderr)
-            return matches[0]
 
+def symbol_search(code: CodeNode, index: SymbolIndex) -> Dict[SymbolNode, RefType]:
+    """
+    intersect the identifiers of the type summary with the symbol index.
+    a type referenced only from statements without parentheses is a composition, otherwise a method reference.
+    """
+    refs = dict()
+    # inheritance is detected by substring match, any candidate name must lie within a single identifier run
+    for token in code.inheritance_names:
+        for name in index.names_within(token):
+            refs[name] = RefType.INHERITANCE
+    for name in code.field_names & index.keys():
+        refs[name] = RefType.COMPOSITION
+    for name in code.method_names & index.keys():
+        refs[name] = RefType.METHOD
+
+    return {t: refType for name, refType in refs.items() for t in index[name]}
+
+
+def substitute_includes(includes, srcs: Set[SourceNode]):
     srcFiles = {s.srcFile: s for s in srcs}
-    include_anchors = set.union(*[set(v) for v in includes.values()])
-    lookup = {i: best_match(i.srcFile) for i in include_anchors}
+    index = PathIndex(srcFiles.keys())
+    include_anchors = set().union(*includes.values())
+    lookup = {i: index.best_match(i.srcFile) for i in include_anchors}
     for src, incls in includes.items():
         matched_incls = {srcFiles[lookup[i]] for i in incls if lookup[i]}
         includes[src] = matched_incls
 
 
 def substitute_fwd_declares(fwd_declares, declares):
-    types = {}
     for src, fwds in fwd_declares.items():
         substitutes = defaultdict(set)
         for s in declares.get(src, set()):
@@ -201,48 +293,115 @@ def header_src_dict(srcs):
     return result
 
 
-def sort_topological(includes):
-    ts = graphlib.TopologicalSorter(includes)
-    return tuple(ts.static_order())
-
-
-def extended_declares(declares, includes):
+def strongly_connected_components(graph, roots=None):
     """
-    includes form a DAG. This function finds the closure of symbols available in each file (header or source)
+    iterative Tarjan's algorithm over graph: {node: list(node)}
+    return the list of components in reverse topological order, i.e. every component comes after all the
+    components it reaches. if roots is given only the nodes reachable from roots are visited
     """
+    index = dict()
+    low = dict()
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(node):
+        index[node] = low[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        work.append((node, iter(graph.get(node, ()))))
+
+    for root in graph if roots is None else roots:
+        if root in index:
+            continue
+        work = []
+        visit(root)
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    visit(succ)
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def extended_declares(declares, includes, srcs=None):
+    """
+    This function finds the closure of symbols available in each file (header or source).
+    includes may contain cycles, the closure is computed once per strongly connected component and shared by all its
+    members. the closures are kept as bitsets over interned symbols and returned as a lazily decoded ClosureMap
+    if srcs is given, only the closures of srcs and the files they include are computed
+    """
+    table = SymbolTable()
+    own = {s: table.bits(types.keys()) for s, types in declares.items()}
+    all_srcs = declares.keys() | includes.keys() | {i for ins in includes.values() for i in ins}
+    graph = {s: sorted(includes.get(s, set())) for s in sorted(all_srcs)}
     result = dict()
-    self_includes = {s: [i for i in ins if i in declares] for s, ins in includes.items()}
-    srcs = sort_topological(self_includes)
-    discreteSrcs = tuple(declares.keys() - set(srcs))
-    for src in srcs + discreteSrcs:
-        sets = [result.get(i, set()) or set(declares.get(i, dict()).keys()) for i in includes.get(src, set())]
-        result[src] = set.union(set(declares.get(src, dict()).keys()), *sets)
-    return result
-
-
-def deferred_declares(extendedDeclares, headToSrc):
-    result = dict()
-    for src, symbols in extendedDeclares.items():
-        result[src] = set(symbols)
+    cycles = 0
+    # deleted files may be among srcs, they have no closure
+    roots = None if srcs is None else sorted(s for s in srcs if s in graph)
+    for component in strongly_connected_components(graph, roots):
+        members = set(component)
+        if len(component) > 1 or component[0] in includes.get(component[0], set()):
+            cycles += 1
+            print(f'Include cycle: {sorted(component)}', file=sys.stderr)
+        bits = 0
+        for src in component:
+            bits |= own.get(src, 0)
+            for i in includes.get(src, set()):
+                if i not in members:
+                    bits |= result[i]
+        for src in component:
+            result[src] = bits
+    if cycles:
+        print(f'Found {cycles} include cycles', file=sys.stderr)
+    return ClosureMap(table, result)
+
+
+def deferred_declares(extendedDeclares: ClosureMap, headToSrc):
+    result = dict(extendedDeclares.bits)
+    for src in result:
         if src in headToSrc:
-            result[src] |= extendedDeclares[headToSrc[src]]
-    return result
+            result[src] |= extendedDeclares.bits.get(headToSrc[src], 0)
+    return ClosureMap(extendedDeclares.table, result)
 
 
 def identify_symbol_src(includes: dict, declares: dict, fwd_declares: dict):
     srcs = includes.keys() | declares.keys() | fwd_declares.keys()
-    substitute_includes(includes, srcs)
-    extendedDeclares = extended_declares(declares, includes)
-    headerToSrc = header_src_dict(srcs)
-    # verify header to src
-    for h, s in headerToSrc.items():
-        if h not in includes[s]:
-            print(f'Error: source file {s} should but does not include header {h}', file=sys.stderr)
-    deferredDeclares = deferred_declares(extendedDeclares, headerToSrc)
-    substitute_fwd_declares(fwd_declares, deferredDeclares)
-
-
-def dep_analysis(folders):
+    with profiler.phase('include_resolution'):
+        substitute_includes(includes, srcs)
+        headerToSrc = header_src_dict(srcs)
+    with profiler.phase('closure'):
+        extendedDeclares = extended_declares(declares, includes)
+        # verify header to src
+        for h, s in headerToSrc.items():
+            if h not in includes[s]:
+                print(f'Error: source file {s} should but does not include header {h}', file=sys.stderr)
+        deferredDeclares = deferred_declares(extendedDeclares, headerToSrc)
+        substitute_fwd_declares(fwd_declares, deferredDeclares)
+    return headerToSrc
+
+
+def find_edges(declares, includes, fwd_declares, srcs=None, edges=None):
+    """
+    search the class bodies declared in srcs, all files by default, for dependencies on the types visible to them
+    """
     def get_included_types(src):
         included_types = set()
         for s in includes.get(src, set()):
@@ -250,26 +409,94 @@ def dep_analysis(folders):
                 included_types.add(ts)
         return included_types
 
-    includes = dict()
-    declares = dict()
-    fwd_declares = dict()
-    for folder in folders:
-        i, d, f = source_proc(folder)
-        includes.update(i)
-        declares.update(d)
-        fwd_declares.update(f)
-
-    identify_symbol_src(includes, declares, fwd_declares)
-    nodes = {k for v in declares.values() for k in v.keys()}
-    edges = set()
-    for src, types in declares.items():
+    edges = EdgeStore() if edges is None else edges
+    for src in declares.keys() if srcs is None else sorted(s for s in srcs if s in declares):
+        types = declares[src]
         included_types = get_included_types(src)
         fwd_types = fwd_declares.get(src, set())
+        index = symbol_index(included_types | fwd_types)
         for t, code in types.items():
             # for each declared type t, search code for dependencies in included_types
-            deps = symbol_search(code, included_types | fwd_types)
+            deps = symbol_search(code, index)
             for d, refType in deps.items():
-                edges.add(EdgeNode(t, d, refType))
+                edges.add(t, d, refType)
+    return edges
+
+
+def focused_edges(declares, includes, fwd_declares, focus_names, depth=1, direction='both'):
+    """
+    search only the class bodies of the types within depth hops of the types named focus_names, following
+    dependencies in direction 'in', 'out' or 'both', instead of every class body.
+    a type can depend on a focus type only if its summary mentions the name, so the types reaching the focus are found
+    through an inverted index of the summaries before any search.
+    return the edges of the subgraph induced by these types
+    """
+    owner = {t: src for src, types in declares.items() for t in types}
+    indexes = dict()
+    found = dict()
+
+    def search(t):
+        deps = found.get(t)
+        if deps is None:
+            src = owner[t]
+            index = indexes.get(src)
+            if index is None:
+                included = {ts for s in includes.get(src, set()) for ts in declares.get(s, dict()).keys()}
+                index = indexes[src] = symbol_index(included | fwd_declares.get(src, set()))
+            deps = found[t] = symbol_search(declares[src][t], index)
+        return deps
+
+    mentions = defaultdict(set)
+    if direction != 'out':
+        names = SymbolIndex(owner)
+        for t, src in owner.items():
+            code = declares[src][t]
+            for name in code.field_names | code.method_names:
+                mentions[name].add(t)
+            for token in code.inheritance_names:
+                for name in names.names_within(token):
+                    mentions[name].add(t)
+
+    nodes = {t for t in owner if t.name in focus_names}
+    frontier = set(nodes)
+    for _ in range(depth):
+        reached = set()
+        for t in frontier:
+            if direction != 'in':
+                reached |= search(t).keys()
+            if direction != 'out':
+                reached |= {c for c in mentions.get(t.name, ()) if t in search(c)}
+        frontier = reached - nodes
+        nodes |= frontier
+        if not frontier:
+            break
+
+    edges = EdgeStore()
+    for t in sorted(nodes, key=lambda t: (owner[t], t.name)):
+        for d, refType in search(t).items():
+            if d in nodes:
+                edges.add(t, d, refType)
+    return edges
+
+
+def dep_analysis(folders, jobs=max_workers, executor='process', cache_dir=None, reader='text',
+                 excludes=default_excludes, use_gitignore=True, focus=None, depth=1, direction='both'):
+    """
+    focus: if given, the names of the types whose neighborhood of depth hops in direction is searched for edges, other
+    class bodies are skipped. the include state is not saved then, the edges being partial
+    """
+    includes, declares, fwd_declares = source_proc(folders, jobs, executor, cache_dir, reader, excludes, use_gitignore)
+    headerToSrc = identify_symbol_src(includes, declares, fwd_declares)
+    if cache_dir and not focus:
+        save_include_state(cache_dir, includes, headerToSrc)
+    nodes = {k for v in declares.values() for k in v.keys()}
+    with profiler.phase('symbol_search'):
+        if focus:
+            edges = focused_edges(declares, includes, fwd_declares, set(focus), depth, direction)
+        else:
+            edges = find_edges(declares, includes, fwd_declares)
+    profiler.count('types', len(nodes))
+    profiler.count('edges', len(edges))
     return nodes, edges
 
 
@@ -294,8 +521,17 @@ def verify_data(nodes, edges):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('folders', metavar='directory', nargs='+', help='Path to the folder(s) to scan for src')
+    parser.add_argument('-j', '--jobs', type=int, default=max_workers, help='Number of parallel parsing workers')
+    parser.add_argument('--executor', choices=executors, default='process', help='Parallel backend used for parsing')
+    parser.add_argument('--cache-dir', help='Directory of the persistent parse cache. default: no cache')
+    parser.add_argument('--reader', choices=readers, default='text', help='How source files are read: decoded text or memory mapped bytes')
+    parser.add_argument('--exclude', action='append', help=f'Glob of files or directories to skip, may be repeated. default: {default_excludes}')
+    parser.add_argument('--no-gitignore', action='store_true', help='Do not skip the files ignored by .gitignore')
+    parser.add_argument('--log-level', choices=log_levels, default='warning', help='debug logs every parsed file')
     args = parser.parse_args()
-    nodes, edges = dep_analysis(args.folders)
+    configure_logging(args.log_level.upper())
+    excludes = default_excludes if args.exclude is None else args.exclude
+    nodes, edges = dep_analysis(args.folders, args.jobs, args.executor, args.cache_dir, args.reader, excludes, not args.no_gitignore)
     verify_data(nodes, edges)
     write_nodes(nodes)
     write_edges(edges)
@@ -1,16 +1,51 @@
 #!/usr/bin/env python3
 
 import argparse
+import cProfile
 import os.path
 
-from dependency_gen import dep_analysis, verify_data, write_nodes, write_edges
-from dependency_vis import create_graphviz
+import profiler
+from dependency_gen import dep_analysis, verify_data, write_nodes, write_edges, write_binary_graph, max_workers, executors, \
+    default_excludes, log_levels, configure_logging
+from dependency_vis import create_graphviz, image_formats, default_formats, engines, cluster_keys, large_graph_threshold
+from incremental import incremental_analysis
+from metrics import compute_metrics, write_metrics, metric_names
+from neighborhood import Adjacency, neighborhood, find_focus, directions
+from sqlite_store import sqlite_analysis, db_file_name
+from watch import watch
+from src_analyzer import readers
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('src_dirs', metavar='source_directories', nargs='+', help='Path to the folder(s) to scan for src')
     parser.add_argument('-o', '--output', help='Directory for the outputs', default='.')
+    parser.add_argument('-j', '--jobs', type=int, default=max_workers, help='Number of parallel parsing workers')
+    parser.add_argument('--executor', choices=executors, default='process', help='Parallel backend used for parsing')
+    parser.add_argument('--cache-dir', help='Directory of the persistent parse cache. default: the output directory')
+    parser.add_argument('--no-cache', action='store_true', help='Parse every file regardless of the parse cache')
+    parser.add_argument('--reader', choices=readers, default='text', help='How source files are read: decoded text or memory mapped bytes')
+    parser.add_argument('--exclude', action='append', help=f'Glob of files or directories to skip, may be repeated. default: {default_excludes}')
+    parser.add_argument('--no-gitignore', action='store_true', help='Do not skip the files ignored by .gitignore')
+    parser.add_argument('--since', metavar='REV', help='Re-analyze only the files changed since the git revision and patch the previous outputs')
+    parser.add_argument('--watch', action='store_true', help='Keep running and update the outputs whenever source files change')
+    parser.add_argument('--store', choices=['memory', 'sqlite'], default='memory', help=f'Where parse results and edges are kept during the analysis. sqlite spills them into {db_file_name} in the output directory')
+    parser.add_argument('--binary', action='store_true', help='Also write the graph in the memory mapped binary format to graph.bin')
+    parser.add_argument('--format', action='append', choices=image_formats, help=f'Image format of the graph, may be repeated. default: {default_formats}')
+    parser.add_argument('--focus', metavar='TYPE[,TYPE]', help='Only keep the neighborhood of these types, written to focus-nodes.txt, focus-edges.txt and the focus graph')
+    parser.add_argument('--depth', type=int, default=1, help='Number of hops around the focus types. default: 1')
+    parser.add_argument('--direction', choices=directions, default='both', help='Follow the dependencies of the focus types (out), their dependents (in) or both')
+    parser.add_argument('--metrics', action='store_true', help='Write fan-in, fan-out, instability, inheritance depth and PageRank of every type to metrics.csv and metrics.json')
+    parser.add_argument('--closure-size', action='store_true', help='Add the number of types each type depends on transitively to the metrics, slow on large graphs')
+    parser.add_argument('--size-by', choices=metric_names, help='Metric sizing the types in the graph. default: their number of edges')
+    parser.add_argument('--engine', choices=engines, help='Graphviz layout engine. default: dot for small graphs, sfdp for large ones')
+    parser.add_argument('--cluster-by', choices=cluster_keys, default='directory', help='How the types of a large graph are grouped into the overview')
+    parser.add_argument('--large-graph', type=int, default=large_graph_threshold, metavar='N', help='Number of types above which an overview of clusters and per-cluster graphs are drawn instead of one graph')
+    parser.add_argument('--profile', metavar='FILE', help='Write per-phase timings, counters, the slowest files, the largest class bodies and the peak RSS to FILE as JSON')
+    parser.add_argument('--profile-top', type=int, default=profiler.default_top, help='Number of slowest files and largest class bodies in the profile')
+    parser.add_argument('--profile-stats', metavar='FILE', help='Dump cProfile statistics of the run to FILE, readable with pstats')
+    parser.add_argument('--log-level', choices=log_levels, default='warning', help='debug logs every parsed file')
     args = parser.parse_args()
+    configure_logging(args.log_level.upper())
     input_dirs = args.src_dirs
     output_dir = args.output
     for d in input_dirs:
@@ -18,8 +53,68 @@ if __name__ == '__main__':
             raise ValueError(f'Input folder do not exist: {d}')
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    nodes, edges = dep_analysis(input_dirs)
-    verify_data(nodes, edges)
-    write_nodes(nodes, os.path.join(output_dir, 'nodes.txt'))
-    write_edges(edges, os.path.join(output_dir, 'edges.txt'))
-    create_graphviz(edges, os.path.join(output_dir, 'graph'))
+    if args.since and args.no_cache:
+        raise ValueError('--since patches the previous run and needs the parse cache')
+    if args.store == 'sqlite' and (args.since or args.watch):
+        raise ValueError('--store sqlite does not support --since or --watch')
+    if args.store == 'sqlite' and (args.cache_dir or args.no_cache):
+        raise ValueError('--store sqlite does not use the parse cache, --cache-dir and --no-cache do not apply')
+    if args.since and args.focus:
+        raise ValueError('--since patches the complete outputs of the previous run and does not support --focus')
+    cache_dir = None if args.no_cache else args.cache_dir or output_dir
+    excludes = default_excludes if args.exclude is None else args.exclude
+    formats = default_formats if args.format is None else list(dict.fromkeys(args.format))
+    focus = [t.strip() for t in args.focus.split(',') if t.strip()] if args.focus else None
+    node_file = os.path.join(output_dir, 'nodes.txt')
+    edge_file = os.path.join(output_dir, 'edges.txt')
+
+    def write_outputs(nodes, edges, verify=verify_data):
+        graph_file = os.path.join(output_dir, 'graph')
+        if focus:
+            nodes, edges = neighborhood(Adjacency(edges), find_focus(nodes, focus), args.depth, args.direction)
+            graph_file = os.path.join(output_dir, 'focus')
+            verify = verify_data
+        with profiler.phase('verify'):
+            verify(nodes, edges)
+        with profiler.phase('write'):
+            write_nodes(nodes, os.path.join(output_dir, 'focus-nodes.txt') if focus else node_file)
+            write_edges(edges, os.path.join(output_dir, 'focus-edges.txt') if focus else edge_file)
+            if args.binary:
+                write_binary_graph(nodes, edges, graph_file + '.bin')
+        weights = None
+        if args.metrics or args.size_by:
+            with profiler.phase('metrics'):
+                metrics = compute_metrics(nodes, edges, args.closure_size or args.size_by == 'closure_size')
+                if args.metrics:
+                    write_metrics(metrics, output_dir)
+                weights = metrics.of(args.size_by) if args.size_by else None
+        with profiler.phase('render'):
+            create_graphviz(edges, graph_file, formats=formats, cache_dir=cache_dir, engine=args.engine,
+                            cluster_by=args.cluster_by, large_threshold=args.large_graph, weights=weights)
+
+    profile = profiler.enable(args.profile_top) if args.profile else None
+    stats = cProfile.Profile() if args.profile_stats else None
+    if stats:
+        stats.enable()
+    try:
+        with profiler.phase('total'):
+            if args.watch:
+                watch(input_dirs, write_outputs, args.jobs, args.executor, cache_dir, args.reader, excludes, not args.no_gitignore)
+            elif args.store == 'sqlite':
+                store = sqlite_analysis(input_dirs, os.path.join(output_dir, db_file_name), args.jobs, args.executor, args.reader, excludes, not args.no_gitignore)
+                try:
+                    # the nodes and edges are streamed from the database into the outputs
+                    write_outputs(store.nodes, store.edges, lambda nodes, edges: store.verify())
+                finally:
+                    store.close()
+            elif args.since:
+                write_outputs(*incremental_analysis(input_dirs, args.since, cache_dir, node_file, edge_file, args.jobs, args.executor, args.reader, excludes, not args.no_gitignore))
+            else:
+                write_outputs(*dep_analysis(input_dirs, args.jobs, args.executor, cache_dir, args.reader, excludes, not args.no_gitignore, focus, args.depth, args.direction))
+    finally:
+        if stats:
+            stats.disable()
+            stats.dump_stats(args.profile_stats)
+            print(f'Saved cProfile statistics to {args.profile_stats}')
+        if profile:
+            profile.save(args.profile)
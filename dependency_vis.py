@@ -1,5 +1,9 @@
-import json
+import concurrent.futures
+import functools
+import hashlib
+import math
 import os
+import re
 from collections import defaultdict
 
 import matplotlib.pyplot as plt
@@ -7,12 +11,24 @@ import networkx as nx
 import plotly.graph_objects as go
 import graphviz as vis
 
-from data_structures import TypeDependencyDecoder, SourceType, RefType, TypeClassifier, EdgeNode
+from data_structures import SourceType, RefType, TypeClassifier
+from graph_io import load_nodes, iter_edge_nodes, load_binary
 
 node_file = os.path.join(os.path.dirname(__file__), "types.txt")
 edge_file = os.path.join(os.path.dirname(__file__), "type-dependencies.txt")
+binary_file = os.path.join(os.path.dirname(__file__), "graph.bin")
 graphvis_file = os.path.join(os.path.dirname(edge_file), "graph")
 nx_graph_file = os.path.join(os.path.dirname(edge_file), ".nxgraph.pdf")
+image_formats = ['pdf', 'jpg', 'svg', 'png']
+default_formats = ['pdf', 'jpg']
+layout_file_prefix = '.layout-'
+layout_cache_size = 8
+engines = ['dot', 'neato', 'sfdp']
+cluster_keys = ['directory', 'file']
+# dot is used up to dot_node_limit nodes, sfdp above. graphs of more than large_graph_threshold types are clustered
+dot_node_limit = 1000
+large_graph_threshold = 2000
+external_color = '#80808080'
 
 
 class NodeProperty:
@@ -35,18 +51,27 @@ def get_color(node):
     return 'red' if node.source.sourceType == SourceType.SOURCE else 'black'
 
 
-def vis_properties(edges, node_scale=3000, smallest_font=1, biggest_font=10):
+def vis_properties(edges, node_scale=3000, smallest_font=1, biggest_font=10, weights=None):
+    """
+    return the drawing properties of the nodes and edges, nodes sized by their degree, or by weights {type name: value}
+    scaled to fractions of the biggest weight
+    """
     node_weight_map = defaultdict(int)
     for e in edges:
         node_weight_map[e.caller] += 1
         node_weight_map[e.callee] += 1
+    if weights is not None:
+        node_weight_map = {n: weights.get(n.name, 0) for n in node_weight_map}
 
     biggest = max(node_weight_map.values())
     smallest = min(node_weight_map.values())
     node_sizes = dict()
     label_fonts = dict()
+    if weights is not None:
+        # every weight may be 0, e.g. the inheritance depths of a graph without inheritance
+        biggest = biggest or 1
     for n, v in node_weight_map.items():
-        node_sizes[n] = v * node_scale // biggest
+        node_sizes[n] = v * node_scale // biggest if weights is None else round(v * node_scale / biggest, 3)
         label_fonts[n] = smallest_font + biggest_font * (v - smallest) // biggest
     edge_weights = {(e.caller, e.callee): EdgeProperty(e, color=get_color(e.caller)) for e in edges}
     node_properties = {n: NodeProperty(n, size=node_sizes[n], color=get_color(n), label=label_fonts[n]) for n in node_weight_map}
@@ -70,22 +95,188 @@ def gplot(edge_trace, node_trace):
                      )
 
 
-def load_data():
-    nodes = dict()
-    with open(node_file, 'r') as fd:
-        for line in fd.readlines():
-            node = json.loads(line, cls=TypeDependencyDecoder)
-            nodes[node.name] = node
+def load_data(stream=False):
+    """
+    return ({name: SymbolNode}, set(EdgeNode)) of the binary graph file, or of the node and edge files when it is missing
+    or older, the edges as a generator if stream is set
+    """
+    if os.path.exists(binary_file) and (not os.path.exists(edge_file)
+                                        or os.path.getmtime(binary_file) >= os.path.getmtime(edge_file)):
+        nodes, edges = load_binary(binary_file)
+    else:
+        nodes = load_nodes(node_file)
+        edges = iter_edge_nodes(nodes, edge_file)
+    return nodes, edges if stream else set(edges)
 
-    edges = set()
-    with open(edge_file, 'r') as fd:
-        for line in fd.readlines():
-            edge = json.loads(line)
-            edges.add(EdgeNode(nodes[edge['caller']], nodes[edge['callee']], RefType[edge['refType']]))
-    return nodes, edges
 
+def layout(graph, cache_dir=None):
+    """
+    run the layout engine of graph once and return the positioned graph in xdot format.
+    if cache_dir is given the positioned graph is kept there under the hash of the graph source, seed included, so that
+    an unchanged graph is never laid out twice
+    """
+    source = graph.source.encode()
+    if cache_dir is None:
+        return vis.pipe(graph.engine, 'xdot', source)
+    digest = hashlib.sha1(graph.engine.encode() + b'\n' + source).hexdigest()
+    cache_file = os.path.join(cache_dir, f'{layout_file_prefix}{digest}.xdot')
+    if os.path.exists(cache_file):
+        # the modification time orders the layouts by last use
+        os.utime(cache_file)
+        print(f'Reusing the cached layout {cache_file}')
+        with open(cache_file, 'rb') as fd:
+            return fd.read()
+    positioned = vis.pipe(graph.engine, 'xdot', source)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + '.tmp', 'wb') as fd:
+        fd.write(positioned)
+    os.replace(cache_file + '.tmp', cache_file)
+    return positioned
 
-def create_graphviz(edges, output_file, seed=None):
+
+def prune_layouts(cache_dir, keep=layout_cache_size):
+    """
+    delete all but the keep most recently used layouts of cache_dir
+    """
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.startswith(layout_file_prefix)]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for f in files[keep:]:
+        os.remove(f)
+
+
+def export(positioned, output_file, image_format):
+    """
+    draw an already positioned graph into output_file.image_format without laying it out again
+    """
+    data = vis.pipe('neato', image_format, positioned, neato_no_op=2)
+    file = f'{output_file}.{image_format}'
+    with open(file, 'wb') as fd:
+        fd.write(data)
+    return file
+
+
+def render(graph, output_file, formats=default_formats, cache_dir=None):
+    """
+    lay graph out once and export every format from the positioned graph, each in its own renderer process
+    """
+    positioned = layout(graph, cache_dir)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        files = list(pool.map(functools.partial(export, positioned, output_file), formats))
+    return files
+
+
+def create_graphviz(edges, output_file, seed=None, formats=default_formats, cache_dir=None, engine=None,
+                    cluster_by='directory', large_threshold=large_graph_threshold, weights=None):
+    """
+    draw the dependency graph of edges into output_file.<format>.
+    a graph of more than large_threshold types is drawn as an overview of its clusters, the directories or the source
+    files of the types, and one drill-down graph per cluster in output_file-clusters.
+    engine: graphviz layout engine, chosen by the size of each graph if None
+    weights: {type name: metric value} sizing the types, their degree if None
+    """
+    if not edges:
+        print('No edge detected. No graph is to be generated')
+        return
+    nodes = {n for e in edges for n in (e.caller, e.callee)}
+    if len(nodes) > large_threshold:
+        files = create_clustered_graphviz(edges, output_file, seed, formats, cache_dir, engine, cluster_by, weights)
+        print(f'Saved overview to {" and ".join(files[0])} and {len(files) - 1} drill-down graphs to '
+              f'{output_file}-clusters')
+    else:
+        files = [draw_types(edges, output_file, seed, formats, cache_dir, engine or choose_engine(len(nodes)), weights=weights)]
+        print(f'Saved graph to {" and ".join(files[0])}')
+    if cache_dir is not None:
+        prune_layouts(cache_dir, max(layout_cache_size, len(files)))
+
+
+def choose_engine(node_count):
+    return 'dot' if node_count <= dot_node_limit else 'sfdp'
+
+
+def splines(engine):
+    # spline routing is affordable with dot only
+    return 'true' if engine == 'dot' else 'false'
+
+
+def cluster_of(node, cluster_by):
+    return os.path.dirname(node.source.srcFile) if cluster_by == 'directory' else node.source.srcFile
+
+
+def cluster_names(clusters):
+    """
+    return {cluster: (label, file name)} with labels relative to the common path of the clusters
+    """
+    try:
+        root = os.path.commonpath(clusters) if len(clusters) > 1 else os.path.dirname(clusters[0])
+    except ValueError:
+        root = ''
+    names = dict()
+    taken = set()
+    for c in sorted(clusters):
+        label = os.path.relpath(c, root) if root else c
+        name = re.sub(r'[^\w-]+', '_', label).strip('_') or 'root'
+        while name in taken:
+            name += '_'
+        taken.add(name)
+        names[c] = (label, name)
+    return names
+
+
+def create_clustered_graphviz(edges, output_file, seed=None, formats=default_formats, cache_dir=None, engine=None,
+                              cluster_by='directory', weights=None):
+    """
+    draw an overview with one node per cluster and one edge per pair of dependent clusters, weighted by the number of
+    dependencies, then the drill-down graph of every cluster: the edges from or to its types, the types of other
+    clusters greyed out. drill-downs are rendered in parallel.
+    return the list of the files written per graph, the overview first
+    """
+    clusters = defaultdict(set)
+    for e in edges:
+        for n in (e.caller, e.callee):
+            clusters[cluster_of(n, cluster_by)].add(n)
+    names = cluster_names(list(clusters.keys()))
+    drill_dir = f'{output_file}-clusters'
+    os.makedirs(drill_dir, exist_ok=True)
+
+    pair_counts = defaultdict(int)
+    touching = defaultdict(list)
+    for e in edges:
+        a, b = cluster_of(e.caller, cluster_by), cluster_of(e.callee, cluster_by)
+        touching[a].append(e)
+        if a != b:
+            pair_counts[(a, b)] += 1
+            touching[b].append(e)
+
+    engine_used = engine or choose_engine(len(clusters))
+    graph = vis.Digraph(engine=engine_used, graph_attr={'outputorder': 'edgelast', 'splines': splines(engine_used), 'overlap': 'false'})
+    if seed is not None:
+        graph.graph_attr['seed'] = f'{seed}'
+    biggest = max(len(ns) for ns in clusters.values())
+    for c, (label, name) in names.items():
+        size = 1 + 4 * math.sqrt(len(clusters[c]) / biggest)
+        link = {'URL': f'{os.path.basename(drill_dir)}/{name}.svg'} if 'svg' in formats else dict()
+        graph.node(name, label=f'{label}\n{len(clusters[c])} types', shape='box', style='filled', color='#0000ff80', width=str(size), height=str(size / 2), **link)
+    for (a, b), w in sorted(pair_counts.items()):
+        graph.edge(names[a][1], names[b][1], penwidth=str(1 + math.log2(w)), tooltip=f'{w} dependencies')
+    files = [render(graph, output_file, formats, cache_dir)]
+
+    def drill_down(c):
+        external = {n for e in touching[c] for n in (e.caller, e.callee)} - clusters[c]
+        nodes = len(clusters[c]) + len(external)
+        return draw_types(touching[c], os.path.join(drill_dir, names[c][1]), seed, formats, cache_dir,
+                          engine or choose_engine(nodes), external, weights)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        files += pool.map(drill_down, sorted(touching.keys()))
+    return files
+
+
+def draw_types(edges, output_file, seed=None, formats=default_formats, cache_dir=None, engine='dot',
+               external=frozenset(), weights=None):
+    """
+    draw the types of edges and their dependencies, the types of external greyed out, sized by weights
+    return the files written
+    """
     def edge_style(reftype):
         if reftype == RefType.COMPOSITION:
             return {'arrowtail': 'dot', 'dir': 'back'}
@@ -104,20 +295,20 @@ def create_graphviz(edges, output_file, seed=None):
             return {'shape': 'hexagon', 'color': '#0000ff80', 'style': 'filled'}
         return dict()
 
-    if not edges:
-        print('No edge detected. No graph is to be generated')
-        return
-    """ Create a graph from a folder. """
     # Find nodes and clusters
-    graph = vis.Digraph(graph_attr={'layout': 'dot', 'ratio': '.7', 'outputorder': 'edgelast', 'splines': 'true', 'overlap': 'false', 'nodesep': '0.25'})
+    graph = vis.Digraph(engine=engine, graph_attr={'ratio': '.7', 'outputorder': 'edgelast', 'splines': splines(engine), 'overlap': 'false', 'nodesep': '0.25'})
     if seed is not None:
         graph.graph_attr['seed'] = f'{seed}'
     # Find edges and create clusters
-    nodeProperties, edge_properties = vis_properties(edges, node_scale=1, smallest_font=30, biggest_font=50)
-    for (caller, callee), p in edge_properties.items():
+    nodeProperties, edge_properties = vis_properties(edges, node_scale=1, smallest_font=30, biggest_font=50, weights=weights)
+    # a stable statement order keeps the source, hence the cached layout, identical across runs
+    for (caller, callee), p in sorted(edge_properties.items(), key=lambda i: (i[0][0].name, i[0][1].name)):
         graph.edge(caller.name, callee.name, color=p.color, penwidth='5', arrowsize='3', **edge_style(p.edge.refType))
-    for n, p in nodeProperties.items():
-        graph.node(n.name, fontsize=str(p.label), width=str(p.size), height=str(p.size), **shape_style(n.classifier))
+    for n, p in sorted(nodeProperties.items(), key=lambda i: i[0].name):
+        style = shape_style(n.classifier)
+        if n in external:
+            style['color'] = external_color
+        graph.node(n.name, fontsize=str(p.label), width=str(p.size), height=str(p.size), **style)
     with graph.subgraph(name='legends', graph_attr={'layout': 'neato'}) as sg:
         import statistics as stats
         legendNodeSize = stats.median([p.size for p in nodeProperties.values()])
@@ -130,10 +321,9 @@ def create_graphviz(edges, output_file, seed=None):
         for i, rt in enumerate(RefType):
             sg.edge(ns[(i + 1) % len(ns)].name, ns[(i + 2) % len(ns)].name, label=rt.name, fontsize=str(legendFontSize), color='#3000ff50', penwidth='5', arrowsize='3', **edge_style(rt))
 
-    graph.render(output_file, cleanup=True, format='pdf')
-    graph.render(output_file, cleanup=True, format='jpg')
-    print(f'Saved graph to {output_file}.pdf and {output_file}.jpg')
+    files = render(graph, output_file, formats, cache_dir)
     del graph
+    return files
 
 
 def create_nx_graph():
@@ -180,5 +370,5 @@ caveats:
 """
 if __name__ == "__main__":
     nodes, edges = load_data()
-    create_graphviz(edges, graphvis_file)
+    create_graphviz(edges, graphvis_file, cache_dir=os.path.dirname(graphvis_file))
     # create_nx_graph()
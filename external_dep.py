@@ -2,16 +2,19 @@ import argparse
 import codecs
 import os
 import queue
-import re
 import threading
 from collections import defaultdict
 
 from graphviz import Digraph
 
-include_regex = re.compile(r'#include\s+["<](.*)[">]')
+from cpp_lexer import tokenize
+from file_walker import walk
+from path_index import PathIndex
+
 valid_headers = ['.h', '.hpp']
 valid_sources = ['.c', '.cc', '.cpp']
 valid_extensions = valid_headers + valid_sources
+stop_dirs = ['tests/', 'build/']
 
 max_queue_size = 7
 assembly_line = queue.Queue(max_queue_size)
@@ -53,29 +56,25 @@ def find_all_files(path, recursive=True):
     Return a list of all the files in the folder.
     If recursive is True, the function will search recursively.
     """
-    files = []
-    for entry in os.scandir(path):
-        if entry.is_dir() and recursive:
-            files += find_all_files(entry.path)
-        elif not stop_file(entry.path):
-            files.append(entry.path)
-    return files
+    return list(walk([path], accept=lambda f: not stop_file(f), excludes=stop_dirs, recursive=recursive))
 
 
 def source_proc(header_files, src_files):
     """
-    return a tuple (includes, declares)
-    includes: dict{src_file : set(includes)}
-    declares: dict{src_file : dict{TypeNode : CodeNode}}
+    return a tuple (used_headers, unused_headers)
+    used_headers: dict{header_file : set(src_files including it)}
+    unused_headers: set of the header files included by none of the src files
+    includes are resolved to header_files through a PathIndex, as in the dependency analysis
     """
+    index = PathIndex(header_files)
 
     def worker():
         while True:
             src_file = assembly_line.get()
             print(f'Processing {src_file}')
             with codecs.open(src_file, 'r', "utf-8", "ignore") as fd:
-                includes = set(include_regex.findall(fd.read()))
-                ads_includes = includes & header_files
+                includes = {m.group('header') for kind, m in tokenize(fd.read()) if kind == 'include'}
+                ads_includes = {index.best_match(i) for i in includes} - {None}
                 if ads_includes:
                     ext_deps[src_file[len(args.rootdir):]] = ads_includes
             print(f'Finished {src_file}')
@@ -104,15 +103,7 @@ def source_proc(header_files, src_files):
 
 def find_srcs(rootdir, subdir):
     files = find_all_files(rootdir)
-    header_files = set()
-    for f in files:
-        if not f.startswith(subdir):
-            continue
-        fn = os.path.basename(f)
-        fdir = os.path.dirname(f)
-        _, ext = os.path.splitext(fn)
-        if ext in valid_headers:
-            header_files.add(os.path.join(os.path.basename(fdir), fn))
+    header_files = {f for f in files if f.startswith(subdir) and get_extension(f) in valid_headers}
     src_files = [f for f in files if not f.startswith(subdir)]
     return header_files, src_files
 
@@ -124,8 +115,8 @@ if __name__ == '__main__':
     args = parser.parse_args()
     proj_header_files, ext_files = find_srcs(args.rootdir, args.subdir)
     ext_deps, unused_headers = source_proc(proj_header_files, ext_files)
-    print(unused_headers)
+    print({h[len(args.rootdir):] for h in unused_headers})
     for es, deps in ext_deps.items():
-        print(f'{es}:')
+        print(f'{es[len(args.rootdir):]}:')
         for dep in deps:
             print(f'\t{dep}')
@@ -0,0 +1,165 @@
+import concurrent.futures
+import os
+import re
+import sys
+
+gitignore_file = '.gitignore'
+always_skipped = {'.git'}
+
+
+def glob_regex(pattern):
+    """
+    translate a gitignore style glob into a regex matching a '/' separated relative path
+    """
+    i = 0
+    regex = ''
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end < 0:
+                regex += re.escape(c)
+            else:
+                chars = pattern[i + 1:end]
+                regex += '[' + ('^' + chars[1:] if chars.startswith('!') else chars) + ']'
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex)
+
+
+class IgnoreRule:
+    def __init__(self, base, pattern) -> None:
+        self.base = base
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        # a pattern with a slash is relative to its base, otherwise it matches a name at any depth
+        self.anchored = '/' in pattern
+        self.regex = glob_regex(pattern.lstrip('/'))
+
+    def match(self, path, name, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        if not self.anchored:
+            return self.regex.fullmatch(name) is not None
+        if not path.startswith(self.base + os.sep):
+            return False
+        rel_path = path[len(self.base) + 1:].replace(os.sep, '/')
+        return self.regex.fullmatch(rel_path) is not None
+
+
+class IgnoreRules:
+    """
+    ordered exclude and .gitignore rules visible in a directory, the last matching rule wins
+    """
+
+    def __init__(self, rules=()) -> None:
+        self.rules = tuple(rules)
+
+    def extend(self, base, patterns):
+        rules = [IgnoreRule(base, p) for p in patterns]
+        return IgnoreRules(self.rules + tuple(rules)) if rules else self
+
+    def ignored(self, path, name, is_dir):
+        result = False
+        for rule in self.rules:
+            if rule.match(path, name, is_dir):
+                result = not rule.negate
+        return result
+
+
+def is_excluded(path, root, excludes):
+    """
+    whether the walk of root with excludes would skip path, by checking path and each of its parent directories
+    """
+    base = root.rstrip(os.sep)
+    rules = IgnoreRules().extend(base, excludes)
+    names = os.path.relpath(path, root).split(os.sep)
+    current = base
+    for i, name in enumerate(names):
+        current = os.path.join(current, name)
+        if name in always_skipped or rules.ignored(current, name, i < len(names) - 1):
+            return True
+    return False
+
+
+def read_gitignore(directory):
+    path = os.path.join(directory, gitignore_file)
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as fd:
+            lines = [line.rstrip('\n').rstrip() for line in fd]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def scan_dir(directory, rules, accept, use_gitignore):
+    """
+    return (files, subdirs) of directory, with subdirs as (path, rules) pairs so that ignored directories are pruned
+    before they are ever listed
+    """
+    if use_gitignore:
+        rules = rules.extend(directory, read_gitignore(directory))
+    files = []
+    subdirs = []
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: e.name)
+    except OSError as e:
+        print(f'Cannot scan {directory}: {e}', file=sys.stderr)
+        return files, subdirs
+    for entry in entries:
+        is_dir = entry.is_dir()
+        if entry.name in always_skipped or rules.ignored(entry.path, entry.name, is_dir):
+            continue
+        if is_dir:
+            subdirs.append((entry.path, rules))
+        elif accept(entry.path):
+            files.append(entry.path)
+    return files, subdirs
+
+
+def walk(roots, accept=lambda path: True, excludes=(), use_gitignore=True, recursive=True, jobs=None):
+    """
+    generate the paths of the files under roots that pass accept.
+    directories are scanned concurrently on a thread pool and paths are yielded as soon as their directory is listed.
+    excludes are gitignore style globs relative to each root, e.g. 'tests', 'build/', 'third_party/**/*.h'
+    a root that is a file is yielded as is.
+    """
+    seen = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = set()
+        for root in roots:
+            if os.path.isfile(root):
+                if root not in seen:
+                    seen.add(root)
+                    yield root
+                continue
+            rules = IgnoreRules().extend(root.rstrip(os.sep), excludes)
+            pending.add(pool.submit(scan_dir, root, rules, accept, use_gitignore))
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for f in files:
+                    if f not in seen:
+                        seen.add(f)
+                        yield f
+                if recursive:
+                    for subdir, rules in subdirs:
+                        pending.add(pool.submit(scan_dir, subdir, rules, accept, use_gitignore))
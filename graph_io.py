@@ -0,0 +1,225 @@
+import json
+import mmap
+import sys
+from array import array
+
+from data_structures import SourceNode, SymbolNode, EdgeNode, RefType, TypeClassifier, symbol_record
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+write_batch_size = 4096
+write_buffer_size = 1 << 20
+
+# binary graph: magic, then header_fields little endian int32 (version and the sizes below), then the int32 arrays
+# string offsets [strings + 1], node name, node source, node classifier [nodes], edge caller, edge callee,
+# edge reftype [edges], then the utf-8 string table. names and paths are indexes into the string table, callers and
+# callees indexes of nodes, classifiers indexes of TypeClassifier and reftypes RefType values
+binary_magic = b'DEPGRAPH'
+binary_version = 1
+header_fields = ('version', 'strings', 'nodes', 'edges', 'string_bytes')
+classifiers = list(TypeClassifier)
+
+if orjson is not None:
+    def encode(record):
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+
+    decode = orjson.loads
+else:
+    # the same bytes as orjson, so that the outputs do not depend on the installed backend
+    compact_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def encode(record):
+        return (compact_encoder.encode(record) + '\n').encode()
+
+    decode = json.loads
+
+
+def write_ndjson(records, file):
+    """
+    write the dicts of records, which may be a generator, one JSON document per line, in batches
+    """
+    with open(file, 'wb', buffering=write_buffer_size) as fd:
+        batch = []
+        for record in records:
+            batch.append(encode(record))
+            if len(batch) >= write_batch_size:
+                fd.write(b''.join(batch))
+                batch = []
+        fd.write(b''.join(batch))
+
+
+def read_ndjson(file):
+    """
+    generate the dicts of a file written by write_ndjson one line at a time
+    """
+    with open(file, 'rb') as fd:
+        for line in fd:
+            if line.strip():
+                yield decode(line)
+
+
+def edge_record(edge):
+    return {'caller': edge.caller.name, 'callee': edge.callee.name, 'refType': edge.refType.name}
+
+
+def write_node_records(nodes, file):
+    write_ndjson(map(symbol_record, nodes), file)
+
+
+def write_edge_records(edges, file):
+    write_ndjson(map(edge_record, edges), file)
+
+
+def iter_nodes(file):
+    """
+    generate the SymbolNodes of a node file, the nodes of one source sharing its SourceNode
+    """
+    sources = dict()
+    for d in read_ndjson(file):
+        source = sources.get(d['source'])
+        if source is None:
+            source = sources[d['source']] = SourceNode(d['source'])
+        yield SymbolNode(d['name'], TypeClassifier[d['classifier']], source)
+
+
+def iter_edges(file):
+    """
+    generate the (caller name, callee name, RefType) of an edge file
+    """
+    for d in read_ndjson(file):
+        yield d['caller'], d['callee'], RefType[d['refType']]
+
+
+def iter_edge_nodes(nodes, file):
+    """
+    generate the EdgeNodes of an edge file, resolving the names with nodes: {name: SymbolNode}
+    """
+    for caller, callee, refType in iter_edges(file):
+        yield EdgeNode(nodes[caller], nodes[callee], refType)
+
+
+def load_nodes(file):
+    """
+    return {name: SymbolNode} of a node file
+    """
+    return {n.name: n for n in iter_nodes(file)}
+
+
+def int32_array(values):
+    result = array('i', values)
+    if sys.byteorder == 'big':
+        result.byteswap()
+    return result
+
+
+def write_binary(nodes, edges, file):
+    """
+    write nodes and edges in the binary graph format, nodes sorted by name and edges by caller, callee and reftype
+    """
+    nodes = sorted(set(nodes).union(*((e.caller, e.callee) for e in edges)), key=lambda n: (n.name, n.source.srcFile))
+    strings = dict()
+    for n in nodes:
+        strings.setdefault(n.name, len(strings))
+        strings.setdefault(n.source.srcFile, len(strings))
+    index = {n: i for i, n in enumerate(nodes)}
+    rows = sorted((index[e.caller], index[e.callee], e.refType.value) for e in edges)
+    encoded = [s.encode() for s in strings]
+    offsets = [0]
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    with open(file, 'wb', buffering=write_buffer_size) as fd:
+        fd.write(binary_magic)
+        int32_array([binary_version, len(strings), len(nodes), len(rows), offsets[-1]]).tofile(fd)
+        int32_array(offsets).tofile(fd)
+        int32_array(strings[n.name] for n in nodes).tofile(fd)
+        int32_array(strings[n.source.srcFile] for n in nodes).tofile(fd)
+        int32_array(classifiers.index(n.classifier) for n in nodes).tofile(fd)
+        for column in range(3):
+            int32_array(r[column] for r in rows).tofile(fd)
+        fd.write(b''.join(encoded))
+
+
+class BinaryGraph:
+    """
+    a graph file written by write_binary, memory mapped: the columns are numpy memmaps when numpy is installed and
+    int32 memoryviews of the mapped file otherwise, so that opening does not depend on the size of the graph
+    """
+
+    def __init__(self, file) -> None:
+        with open(file, 'rb') as fd:
+            self.buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(binary_magic)] != binary_magic:
+            raise ValueError(f'{file} is not a binary graph file')
+        start = len(binary_magic)
+        header = dict(zip(header_fields, self.ints(start, len(header_fields)).tolist()))
+        if header['version'] != binary_version:
+            raise ValueError(f'{file} has version {header["version"]} of the binary graph format, {binary_version} is supported')
+        start += 4 * len(header_fields)
+        self.offsets = self.ints(start, header['strings'] + 1)
+        start += 4 * (header['strings'] + 1)
+        columns = []
+        for size in (header['nodes'],) * 3 + (header['edges'],) * 3:
+            columns.append(self.ints(start, size))
+            start += 4 * size
+        self.node_name, self.node_source, self.node_classifier, self.caller, self.callee, self.ref_type = columns
+        self.string_start = start
+
+    def ints(self, start, size):
+        if numpy is not None:
+            return numpy.frombuffer(self.buffer, dtype='<i4', count=size, offset=start)
+        if sys.byteorder == 'big':
+            result = array('i', self.buffer[start:start + 4 * size])
+            result.byteswap()
+            return memoryview(result)
+        return memoryview(self.buffer)[start:start + 4 * size].cast('i')
+
+    def strings(self):
+        """
+        return the decoded string table
+        """
+        table = self.buffer[self.string_start:self.string_start + int(self.offsets[-1])]
+        offsets = self.offsets.tolist()
+        if table.isascii():
+            # byte offsets are character offsets, one decode for the whole table
+            text = table.decode()
+            return [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return [table[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+    def symbol_nodes(self):
+        """
+        return the list of SymbolNodes in node index order, the nodes of one source sharing its SourceNode
+        """
+        strings = self.strings()
+        sources = dict()
+        result = []
+        for name, source, classifier in zip(self.node_name.tolist(), self.node_source.tolist(),
+                                            self.node_classifier.tolist()):
+            if source not in sources:
+                sources[source] = SourceNode(strings[source])
+            result.append(SymbolNode(strings[name], classifiers[classifier], sources[source]))
+        return result
+
+    def edge_nodes(self, symbols):
+        """
+        generate the EdgeNodes, symbols being the list returned by symbol_nodes
+        """
+        ref_types = {t.value: t for t in RefType}
+        for caller, callee, ref_type in zip(self.caller.tolist(), self.callee.tolist(), self.ref_type.tolist()):
+            yield EdgeNode(symbols[caller], symbols[callee], ref_types[ref_type])
+
+
+def load_binary(file):
+    """
+    return ({name: SymbolNode}, generator of EdgeNode) of a binary graph file
+    """
+    graph = BinaryGraph(file)
+    symbols = graph.symbol_nodes()
+    return {n.name: n for n in symbols}, graph.edge_nodes(symbols)
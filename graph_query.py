@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import argparse
+import functools
+import os
+import sys
+from array import array
+from collections import deque
+
+from data_structures import RefType
+from graph_io import BinaryGraph, load_nodes, iter_edges, numpy
+
+query_cache_size = 4096
+query_kinds = ['dependencies', 'dependents', 'path']
+
+
+def csr(n, sources, targets, ref_types):
+    """
+    return (offsets, targets, ref_types) int32 arrays of the compressed sparse rows of the edges sources[i] ->
+    targets[i], the targets of node v being targets[offsets[v]:offsets[v + 1]]
+    """
+    if numpy is not None:
+        sources = numpy.asarray(sources, dtype='i4')
+        order = numpy.argsort(sources, kind='stable')
+        offsets = numpy.zeros(n + 1, dtype='i4')
+        numpy.cumsum(numpy.bincount(sources, minlength=n), out=offsets[1:])
+        columns = (offsets, numpy.asarray(targets, dtype='i4')[order], numpy.asarray(ref_types, dtype='i4')[order])
+        return tuple(array('i', c.astype('=i4').tobytes()) for c in columns)
+    # counting sort
+    counts = [0] * (n + 1)
+    for s in sources:
+        counts[s + 1] += 1
+    for v in range(n):
+        counts[v + 1] += counts[v]
+    offsets = array('i', counts)
+    position = counts[:-1]
+    sorted_targets = array('i', bytes(4 * len(targets)))
+    sorted_ref_types = array('i', bytes(4 * len(targets)))
+    for s, t, r in zip(sources, targets, ref_types):
+        sorted_targets[position[s]] = t
+        sorted_ref_types[position[s]] = r
+        position[s] += 1
+    return offsets, sorted_targets, sorted_ref_types
+
+
+def ref_type_mask(ref_types):
+    """
+    return the bit mask of the RefType values in ref_types, every reference type if it is empty
+    """
+    return sum(1 << t.value for t in set(ref_types or RefType))
+
+
+all_ref_types = ref_type_mask(None)
+
+
+class GraphIndex:
+    """
+    forward and reverse CSR adjacency of a dependency graph answering dependency queries by type name.
+    results are tuples of names, memoized with an LRU cache
+    """
+
+    def __init__(self, names, callers, callees, ref_types, cache_size=query_cache_size) -> None:
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.forward = csr(len(names), callers, callees, ref_types)
+        self.reverse = csr(len(names), callees, callers, ref_types)
+        self.edge_count = len(callers)
+        self.dependencies = functools.lru_cache(cache_size)(self.dependencies)
+        self.dependents = functools.lru_cache(cache_size)(self.dependents)
+        self.path = functools.lru_cache(cache_size)(self.path)
+
+    def neighbors(self, adjacency, v, mask):
+        offsets, targets, ref_types = adjacency
+        start, end = offsets[v], offsets[v + 1]
+        if mask == all_ref_types:
+            return targets[start:end]
+        return [t for t, r in zip(targets[start:end], ref_types[start:end]) if mask >> r & 1]
+
+    def reach(self, adjacency, name, ref_types, transitive):
+        v = self.ids[name]
+        mask = ref_type_mask(ref_types)
+        if not transitive:
+            return tuple(sorted({self.names[t] for t in self.neighbors(adjacency, v, mask)}))
+        seen = bytearray(len(self.names))
+        seen[v] = 1
+        frontier = [v]
+        reached = []
+        while frontier:
+            next_frontier = []
+            for u in frontier:
+                for t in self.neighbors(adjacency, u, mask):
+                    if not seen[t]:
+                        seen[t] = 1
+                        next_frontier.append(t)
+            reached += next_frontier
+            frontier = next_frontier
+        return tuple(sorted(self.names[t] for t in reached))
+
+    def dependencies(self, name, ref_types=frozenset(), transitive=False):
+        """
+        return the names of the types name depends on, directly or transitively, over edges of ref_types
+        """
+        return self.reach(self.forward, name, ref_types, transitive)
+
+    def dependents(self, name, ref_types=frozenset(), transitive=False):
+        """
+        return the names of the types depending on name, directly or transitively, over edges of ref_types
+        """
+        return self.reach(self.reverse, name, ref_types, transitive)
+
+    def path(self, source, target, ref_types=frozenset()):
+        """
+        return the names along a shortest dependency path from source to target over edges of ref_types, None if
+        target is not reachable
+        """
+        start, goal = self.ids[source], self.ids[target]
+        mask = ref_type_mask(ref_types)
+        parents = {start: None}
+        queue = deque([start])
+        while queue and goal not in parents:
+            u = queue.popleft()
+            for t in self.neighbors(self.forward, u, mask):
+                if t not in parents:
+                    parents[t] = u
+                    queue.append(t)
+        if goal not in parents:
+            return None
+        result = []
+        v = goal
+        while v is not None:
+            result.append(self.names[v])
+            v = parents[v]
+        return tuple(reversed(result))
+
+
+def index_text(node_file, edge_file):
+    """
+    return the GraphIndex of a node and an edge file
+    """
+    names = list(load_nodes(node_file))
+    ids = {name: i for i, name in enumerate(names)}
+    callers, callees, ref_types = array('i'), array('i'), array('i')
+    for caller, callee, ref_type in iter_edges(edge_file):
+        callers.append(ids[caller])
+        callees.append(ids[callee])
+        ref_types.append(ref_type.value)
+    return GraphIndex(names, callers, callees, ref_types)
+
+
+def index_binary(file):
+    """
+    return the GraphIndex of a binary graph file, the types of the same name sharing one vertex as in the text files
+    """
+    graph = BinaryGraph(file)
+    strings = graph.strings()
+    ids = dict()
+    vertex = array('i', (ids.setdefault(strings[i], len(ids)) for i in graph.node_name.tolist()))
+    callers, callees = graph.caller, graph.callee
+    if numpy is not None:
+        vertex = numpy.frombuffer(vertex, dtype='i4')
+        callers, callees = vertex[callers], vertex[callees]
+    else:
+        callers = array('i', (vertex[c] for c in callers))
+        callees = array('i', (vertex[c] for c in callees))
+    return GraphIndex(list(ids), callers, callees, graph.ref_type)
+
+
+def load_index(output_dir):
+    """
+    return the GraphIndex of the outputs in output_dir, from graph.bin when it is not older than edges.txt
+    """
+    binary_file = os.path.join(output_dir, 'graph.bin')
+    edge_file = os.path.join(output_dir, 'edges.txt')
+    if os.path.exists(binary_file) and (not os.path.exists(edge_file)
+                                        or os.path.getmtime(binary_file) >= os.path.getmtime(edge_file)):
+        return index_binary(binary_file)
+    return index_text(os.path.join(output_dir, 'nodes.txt'), edge_file)
+
+
+def run_query(index, kind, names, ref_types=frozenset(), transitive=False):
+    if kind == 'path':
+        return index.path(names[0], names[1], ref_types)
+    if kind == 'dependencies':
+        return index.dependencies(names[0], ref_types, transitive)
+    return index.dependents(names[0], ref_types, transitive)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the dependencies in the outputs of dependency_graph.py')
+    parser.add_argument('kind', choices=query_kinds, help='Types the type depends on, types depending on it, or a shortest path between two types')
+    parser.add_argument('types', nargs='+', metavar='TYPE', help='The type, or the source and target types of a path')
+    parser.add_argument('-o', '--output', default='.', help='Directory of the outputs of dependency_graph.py')
+    parser.add_argument('-t', '--transitive', action='store_true', help='Follow dependencies transitively')
+    parser.add_argument('--ref-type', action='append', choices=[t.name.lower() for t in RefType], help='Only follow references of this type, may be repeated. default: all')
+    args = parser.parse_args()
+    if len(args.types) != (2 if args.kind == 'path' else 1):
+        parser.error('path takes a source and a target type, the other queries one type')
+    ref_types = frozenset(RefType[t.upper()] for t in args.ref_type or ())
+    index = load_index(args.output)
+    missing = [t for t in args.types if t not in index.ids]
+    if missing:
+        print(f'Types not found: {missing}', file=sys.stderr)
+        sys.exit(1)
+    result = run_query(index, args.kind, args.types, ref_types, args.transitive)
+    if result is None:
+        print(f'No path from {args.types[0]} to {args.types[1]}', file=sys.stderr)
+        sys.exit(1)
+    print(' -> '.join(result) if args.kind == 'path' else '\n'.join(result))
@@ -0,0 +1,158 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+import profiler
+from data_structures import SourceNode, EdgeNode
+from dependency_gen import (parse_sources, merge_records, substitute_includes, header_src_dict, extended_declares,
+                            deferred_declares, substitute_fwd_declares, find_edges, dep_analysis, has_valid_extension,
+                            max_workers, default_excludes)
+from file_walker import is_excluded
+from graph_io import load_nodes, iter_edges
+from parse_cache import ParseCache, load_include_state, save_include_state
+
+
+def git(directory, *args):
+    return subprocess.run(['git', '-C', directory, *args], check=True, capture_output=True, text=True).stdout
+
+
+def git_changed_files(rev, folders):
+    """
+    return the real paths of the files changed in the work trees of folders since rev, untracked files included.
+    a renamed file counts as the deletion of its old path and the addition of its new one
+    """
+    changed = set()
+    tops = {git(f if os.path.isdir(f) else os.path.dirname(f) or '.', 'rev-parse', '--show-toplevel').strip()
+            for f in folders}
+    for top in tops:
+        paths = git(top, 'diff', '--name-only', '--no-renames', rev, '--').splitlines()
+        paths += git(top, 'ls-files', '--others', '--exclude-standard').splitlines()
+        changed |= {os.path.realpath(os.path.join(top, p)) for p in paths if p}
+    return changed
+
+
+def to_walk_paths(real_paths, folders, excludes):
+    """
+    translate real paths into the paths the walker would produce for folders, dropping the ones it would skip
+    """
+    result = set()
+    for folder in folders:
+        real_folder = os.path.realpath(folder)
+        for p in real_paths:
+            if os.path.isfile(folder):
+                if p == real_folder:
+                    result.add(folder)
+                continue
+            if not p.startswith(real_folder + os.sep) or not has_valid_extension(p):
+                continue
+            path = os.path.join(folder, os.path.relpath(p, real_folder))
+            if not is_excluded(path, folder, excludes):
+                result.add(path)
+    return result
+
+
+def dependents(changed, includes_maps, headerToSrc_maps):
+    """
+    return changed and every file whose closure depends on them: the files including them directly or transitively,
+    and the headers paired with an affected source
+    """
+    reverse = defaultdict(set)
+    for includes in includes_maps:
+        for src, incls in includes.items():
+            for i in incls:
+                reverse[i].add(src)
+    for headerToSrc in headerToSrc_maps:
+        for h, s in headerToSrc.items():
+            reverse[s].add(h)
+    result = set(changed)
+    todo = list(changed)
+    while todo:
+        src = todo.pop()
+        for d in reverse.get(src, ()):
+            if d not in result:
+                result.add(d)
+                todo.append(d)
+    return result
+
+
+def load_graph(node_file, edge_file):
+    """
+    return (nodes, edges) of a previous run as {name: SymbolNode} and a list of (caller, callee, RefType) names
+    """
+    return load_nodes(node_file), list(iter_edges(edge_file))
+
+
+def reanalyze(results, changed, oldIncludes, oldHeaderToSrc, oldEdges):
+    """
+    recompute closures and edges only for the files depending on the changed ones
+    results: {src_file: (declares, includes, fwd_declares)} of every current file, changed ones already re-parsed
+    changed: paths of the changed files, deleted ones included
+    oldIncludes, oldHeaderToSrc, oldEdges: resolved includes, header to source pairing and EdgeNodes of the previous
+    analysis, empty for a first analysis with every file changed
+    return a tuple (nodes, edges, includes, headerToSrc)
+    """
+    src_files = sorted(results.keys())
+    includes, declares, fwd_declares = merge_records(src_files, results)
+    srcs = includes.keys() | declares.keys() | fwd_declares.keys()
+    with profiler.phase('include_resolution'):
+        # an include resolves differently only when a file of its basename was changed, added or deleted
+        changed_names = {os.path.basename(f) for f in changed}
+        unresolved = {s: incls for s, incls in includes.items()
+                      if s.srcFile in changed or s not in oldIncludes
+                      or any(os.path.basename(i.srcFile) in changed_names for i in incls)}
+        substitute_includes(unresolved, srcs)
+        for s in includes:
+            includes[s] = unresolved[s] if s in unresolved else oldIncludes[s]
+        headerToSrc = header_src_dict(srcs)
+        affected = dependents({SourceNode(f) for f in changed}, [oldIncludes, includes], [oldHeaderToSrc, headerToSrc])
+    print(f'{len(affected)} files affected by the change')
+    profiler.count('affected_files', len(affected))
+    partners = {headerToSrc[s] for s in affected if s in headerToSrc}
+    with profiler.phase('closure'):
+        extendedDeclares = extended_declares(declares, includes, affected | partners)
+        deferredDeclares = deferred_declares(extendedDeclares, headerToSrc)
+        affected_fwd_declares = {s: f for s, f in fwd_declares.items() if s in affected}
+        substitute_fwd_declares(affected_fwd_declares, deferredDeclares)
+        fwd_declares.update(affected_fwd_declares)
+
+    nodes = {k for v in declares.values() for k in v.keys()}
+    with profiler.phase('symbol_search'):
+        edges = find_edges(declares, includes, fwd_declares, affected)
+    for edge in oldEdges:
+        if edge.caller.source not in affected:
+            edges.add(edge.caller, edge.callee, edge.refType)
+    return nodes, edges, includes, headerToSrc
+
+
+def incremental_analysis(folders, since, cache_dir, node_file, edge_file, jobs=max_workers, executor='process',
+                         reader='text', excludes=default_excludes, use_gitignore=True):
+    """
+    re-parse only the files changed since the git revision since, recompute closures and edges only for the files
+    depending on them and patch the result into the nodes and edges of the previous run.
+    falls back to a full dep_analysis when there is no previous run to patch.
+    """
+    cache = ParseCache(cache_dir)
+    state = load_include_state(cache_dir)
+    if not cache.entries or state is None or not os.path.exists(node_file) or not os.path.exists(edge_file):
+        print('No previous analysis to patch, running a full analysis', file=sys.stderr)
+        return dep_analysis(folders, jobs, executor, cache_dir, reader, excludes, use_gitignore)
+    oldIncludes, oldHeaderToSrc = state
+    oldNodes, oldEdges = load_graph(node_file, edge_file)
+
+    changed = to_walk_paths(git_changed_files(since, folders), folders, excludes)
+    existing = {f for f in changed if os.path.isfile(f)}
+    print(f'{len(changed)} code files changed since {since}')
+    src_files = sorted((cache.entries.keys() - changed) | existing)
+    with profiler.phase('parse'):
+        parsed = parse_sources(sorted(existing), jobs, executor, reader)
+    for src_file, result in parsed.items():
+        cache.store(src_file, result)
+    cache.prune(set(src_files))
+    cache.save()
+    results = {f: parsed[f] if f in parsed else cache.entries[f][3] for f in src_files}
+
+    oldEdges = (EdgeNode(oldNodes[caller], oldNodes[callee], refType) for caller, callee, refType in oldEdges)
+    nodes, edges, includes, headerToSrc = reanalyze(results, changed, oldIncludes, oldHeaderToSrc, oldEdges)
+    save_include_state(cache_dir, includes, headerToSrc)
+    return nodes, edges
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.client
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit, urlencode
+
+from data_structures import SourceNode, SymbolNode, EdgeNode, RefType, TypeClassifier
+from graph_io import write_node_records, write_edge_records, write_binary, decode
+from query_server import GraphService, create_server
+
+default_clients = 8
+default_seconds = 5.0
+default_rewrite_seconds = 1.0
+reload_seconds = 0.2
+
+
+def synthetic_graph(types=10000, edges=50000, seed=0):
+    """
+    return (nodes, edges) of a random graph of types and edges, mostly pointing from a type to types of lower index
+    like the layers of a code base. the types are named T0, T1, ... whatever the seed
+    """
+    rng = random.Random(seed)
+    nodes = [SymbolNode(f'T{i}', rng.choice(list(TypeClassifier)), SourceNode(f'dir_{i // 100}/t{i // 4}.h'))
+             for i in range(types)]
+    edge_set = set()
+    for _ in range(edges):
+        caller = rng.randrange(1, types)
+        callee = max(0, caller - 1 - int(rng.expovariate(0.05)))
+        edge_set.add(EdgeNode(nodes[caller], nodes[callee], rng.choice(list(RefType))))
+    return nodes, edge_set
+
+
+def synthetic_outputs(output_dir, types=10000, edges=50000, seed=0):
+    """
+    write nodes.txt, edges.txt and graph.bin of a synthetic_graph into output_dir, return the names of its types
+    """
+    nodes, edge_set = synthetic_graph(types, edges, seed)
+    os.makedirs(output_dir, exist_ok=True)
+    write_node_records(nodes, os.path.join(output_dir, 'nodes.txt'))
+    write_edge_records(edge_set, os.path.join(output_dir, 'edges.txt'))
+    write_binary(nodes, edge_set, os.path.join(output_dir, 'graph.bin'))
+    return [n.name for n in nodes]
+
+
+def rewrite(output_dir, types, edges, interval, stopped):
+    """
+    rewrite graph.bin in output_dir with a synthetic graph of new edges between the same types every interval seconds
+    until stopped is set, so that the server reloads while it is queried
+    """
+    seed = 1
+    while not stopped.wait(interval):
+        write_binary(*synthetic_graph(types, edges, seed), os.path.join(output_dir, 'graph.bin'))
+        seed += 1
+
+
+def random_request(rng, names):
+    kind = rng.choice(['dependencies', 'dependents', 'path'])
+    if kind == 'path':
+        params = {'source': rng.choice(names), 'target': rng.choice(names)}
+    else:
+        params = {'type': rng.choice(names), 'transitive': rng.choice(['0', '1'])}
+    if rng.random() < 0.3:
+        params['ref_type'] = rng.choice(list(RefType)).name.lower()
+    return f'/{kind}?{urlencode(params)}'
+
+
+def client(url, names, seed, deadline, results):
+    """
+    send random queries over one kept alive connection until deadline, appending (latency, status) to results.
+    a request failing without a response has status None and the connection is opened again
+    """
+    rng = random.Random(seed)
+    location = urlsplit(url)
+    connection = http.client.HTTPConnection(location.hostname, location.port)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', random_request(rng, names))
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = None
+            connection.close()
+        results.append((time.perf_counter() - start, status))
+    connection.close()
+
+
+def run(url, names, clients=default_clients, seconds=default_seconds):
+    """
+    return the (latency, status) of every request sent by clients concurrent clients during seconds
+    """
+    results = []
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=client, args=(url, names, seed, deadline, results)) for seed in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summary(results, seconds):
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if r[1] != 200)
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    return (f'{len(results)} requests in {seconds:.1f}s: {len(results) / seconds:.0f} requests/s, '
+            f'p50 {p50 * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms, {errors} errors')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the requests per second of query_server.py')
+    parser.add_argument('--url', help='Address of a running query_server.py. default: serve a synthetic graph in process')
+    parser.add_argument('-o', '--output', help='Outputs of dependency_graph.py to serve or to pick the queried types from. default: a synthetic graph')
+    parser.add_argument('--types', type=int, default=10000, help='Number of types of the synthetic graph')
+    parser.add_argument('--edges', type=int, default=50000, help='Number of edges of the synthetic graph')
+    parser.add_argument('--clients', type=int, default=default_clients, help='Number of concurrent clients')
+    parser.add_argument('--seconds', type=float, default=default_seconds, help='Duration of the test')
+    parser.add_argument('--rewrite-every', type=float, default=default_rewrite_seconds, help='Seconds between rewrites of graph.bin of the synthetic graph served in process, 0 to never rewrite it')
+    args = parser.parse_args()
+    output_dir = args.output or tempfile.mkdtemp(prefix='dependency-graph-load-')
+    if args.output:
+        with open(os.path.join(output_dir, 'nodes.txt'), 'rb') as fd:
+            names = [decode(line)['name'] for line in fd if line.strip()]
+    else:
+        names = synthetic_outputs(output_dir, args.types, args.edges)
+        print(f'Wrote a synthetic graph of {args.types} types and {args.edges} edges to {output_dir}')
+    service = server = None
+    url = args.url
+    stopped = threading.Event()
+    rewriting = url is None and not args.output and args.rewrite_every > 0
+    if url is None:
+        service = GraphService(output_dir, reload_seconds)
+        service.start()
+        server = create_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+    if rewriting:
+        threading.Thread(target=rewrite, args=(output_dir, args.types, args.edges, args.rewrite_every, stopped),
+                         daemon=True).start()
+    results = run(url, names, args.clients, args.seconds)
+    stopped.set()
+    print(summary(results, args.seconds))
+    if server:
+        service.stop()
+        server.shutdown()
+        server.server_close()
+    failed = sum(1 for r in results if r[1] != 200)
+    if failed:
+        print(f'{failed} requests failed', file=sys.stderr)
+        sys.exit(1)
+    if rewriting and service.generation == 1:
+        print(f'The graph was rewritten every {args.rewrite_every}s but never reloaded', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import os
+import time
+from array import array
+
+from data_structures import RefType, EdgeStore
+from graph_io import numpy, write_ndjson, load_binary, load_nodes, iter_edge_nodes
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    connected_components = None
+
+pagerank_damping = 0.85
+pagerank_iterations = 100
+pagerank_tolerance = 1e-6
+fan_metrics = [f'fan_{d}_{t.name.lower()}' for d in ('in', 'out') for t in RefType]
+metric_names = ['fan_in', 'fan_out'] + fan_metrics + ['instability', 'inheritance_depth', 'closure_size', 'pagerank']
+
+
+class GraphMetrics:
+    """
+    per type metrics of a graph: columns {metric: list of values}, the values of nodes[i] at index i
+    """
+
+    def __init__(self, nodes, columns) -> None:
+        self.nodes = nodes
+        self.columns = columns
+
+    def of(self, metric):
+        """
+        return {type name: value} of metric
+        """
+        return {n.name: v for n, v in zip(self.nodes, self.columns[metric])}
+
+    def metric_names(self):
+        return [m for m in metric_names if m in self.columns]
+
+    def records(self):
+        names = self.metric_names()
+        for i, n in enumerate(self.nodes):
+            record = {'name': n.name, 'source': n.source.srcFile}
+            record.update((m, self.columns[m][i]) for m in names)
+            yield record
+
+    def write_csv(self, file):
+        with open(file, 'w', newline='') as fd:
+            writer = csv.DictWriter(fd, ['name', 'source'] + self.metric_names())
+            writer.writeheader()
+            writer.writerows(self.records())
+
+    def write_json(self, file):
+        write_ndjson(self.records(), file)
+
+
+def edge_columns(nodes, edges):
+    """
+    return (types, caller, callee, ref type value) of nodes and edges: types the SymbolNodes sorted by name, one per
+    name like in the text outputs and the drawn graph, and int32 arrays of the edges, the types being indexes in types.
+    the id arrays of an EdgeStore are mapped without going through its EdgeNodes
+    """
+    by_name = {n.name: n for n in nodes}
+    if isinstance(edges, EdgeStore):
+        symbols = edges.table.symbols
+        found = {symbols[i].name: symbols[i] for i in set(edges.callers).union(edges.callees)}
+        found.update(by_name)
+        by_name = found
+        names = sorted(by_name)
+        index = {name: i for i, name in enumerate(names)}
+        vertex = [index.get(s.name, -1) for s in symbols]
+        return ([by_name[name] for name in names], array('i', map(vertex.__getitem__, edges.callers)),
+                array('i', map(vertex.__getitem__, edges.callees)), array('i', edges.refTypes))
+    edges = list(edges)
+    caller_names = [e.caller.name for e in edges]
+    callee_names = [e.callee.name for e in edges]
+    # the types only found in edges
+    missing = set(caller_names).union(callee_names) - by_name.keys()
+    for e in edges if missing else ():
+        for n in (e.caller, e.callee):
+            if n.name in missing:
+                by_name.setdefault(n.name, n)
+    names = sorted(by_name)
+    index = {name: i for i, name in enumerate(names)}
+    return ([by_name[name] for name in names], array('i', map(index.__getitem__, caller_names)),
+            array('i', map(index.__getitem__, callee_names)), array('i', [e.refType.value for e in edges]))
+
+
+def fan_counts(n, callers, callees, ref_types):
+    """
+    return {metric: values} of the edges of every reference type from and to each type, their totals fan_in and
+    fan_out and the instability
+    """
+    counts = dict()
+    if numpy is not None:
+        callers, callees, ref_types = (numpy.frombuffer(c, dtype='i') for c in (callers, callees, ref_types))
+        fan_in, fan_out = numpy.zeros(n, dtype='i8'), numpy.zeros(n, dtype='i8')
+        for t in RefType:
+            selected = ref_types == t.value
+            counted_in = numpy.bincount(callees[selected], minlength=n)
+            counted_out = numpy.bincount(callers[selected], minlength=n)
+            fan_in += counted_in
+            fan_out += counted_out
+            counts[f'fan_in_{t.name.lower()}'] = counted_in.tolist()
+            counts[f'fan_out_{t.name.lower()}'] = counted_out.tolist()
+        total = fan_in + fan_out
+        counts['fan_in'] = fan_in.tolist()
+        counts['fan_out'] = fan_out.tolist()
+        counts['instability'] = numpy.divide(fan_out, total, out=numpy.zeros(n), where=total > 0).tolist()
+        return counts
+    for t in RefType:
+        counts[f'fan_in_{t.name.lower()}'] = [0] * n
+        counts[f'fan_out_{t.name.lower()}'] = [0] * n
+    names = {t.value: t.name.lower() for t in RefType}
+    for caller, callee, ref_type in zip(callers, callees, ref_types):
+        counts[f'fan_in_{names[ref_type]}'][callee] += 1
+        counts[f'fan_out_{names[ref_type]}'][caller] += 1
+    counts['fan_in'] = [sum(c) for c in zip(*(counts[f'fan_in_{t.name.lower()}'] for t in RefType))]
+    counts['fan_out'] = [sum(c) for c in zip(*(counts[f'fan_out_{t.name.lower()}'] for t in RefType))]
+    counts['instability'] = [o / (i + o) if i + o else 0.0 for i, o in zip(counts['fan_in'], counts['fan_out'])]
+    return counts
+
+
+def strong_components(n, successors):
+    """
+    return the strongly connected components of the graph as lists of types, every component listed after the
+    components it reaches (iterative Tarjan)
+    """
+    order = [-1] * n
+    low = [0] * n
+    on_stack = bytearray(n)
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                order[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = 1
+            targets = successors[v]
+            while i < len(targets):
+                w = targets[i]
+                i += 1
+                if order[w] < 0:
+                    work.append((v, i))
+                    work.append((w, 0))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], order[w])
+            else:
+                if low[v] == order[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+    return components
+
+
+def strong_labels(n, sources, targets):
+    """
+    return the numpy array of the strongly connected component of each type of the edges sources[i] -> targets[i],
+    with scipy when it is installed
+    """
+    if connected_components is not None:
+        adjacency = csr_matrix((numpy.ones(len(sources), dtype='i1'), (sources, targets)), shape=(n, n))
+        return connected_components(adjacency, directed=True, connection='strong')[1]
+    successors = [[] for _ in range(n)]
+    for s, t in zip(sources.tolist(), targets.tolist()):
+        successors[s].append(t)
+    labels = numpy.zeros(n, dtype='i8')
+    for k, members in enumerate(strong_components(n, successors)):
+        labels[members] = k
+    return labels
+
+
+def longest_levels(k, sources, targets):
+    """
+    return the numpy array of the length of the longest path from each vertex of the acyclic graph of k vertices and
+    edges sources[i] -> targets[i]. vertices are peeled level by level from the sinks, each level gathering the
+    predecessors of the previous one from the reverse compressed sparse rows
+    """
+    order = numpy.argsort(targets, kind='stable')
+    predecessors = sources[order]
+    starts = numpy.zeros(k + 1, dtype='i8')
+    numpy.cumsum(numpy.bincount(targets, minlength=k), out=starts[1:])
+    remaining = numpy.bincount(sources, minlength=k)
+    level = numpy.zeros(k, dtype='i8')
+    frontier = numpy.flatnonzero(remaining == 0)
+    depth = 0
+    while frontier.size:
+        level[frontier] = depth
+        counts = starts[frontier + 1] - starts[frontier]
+        total = int(counts.sum())
+        if not total:
+            break
+        # positions starts[v] to starts[v + 1] of every vertex v of the frontier
+        positions = numpy.repeat(starts[frontier] - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+        reached = predecessors[positions]
+        numpy.subtract.at(remaining, reached, 1)
+        frontier = numpy.unique(reached[remaining[reached] == 0])
+        depth += 1
+    return level
+
+
+def inheritance_depth(n, callers, callees, ref_types):
+    """
+    return the length of the longest chain of base types above each type, over the components of the inheritance
+    edges in topological order. the types of an inheritance cycle, which only name collisions produce, share one depth
+    """
+    if numpy is not None:
+        if n == 0:
+            return []
+        callers, callees, ref_types = (numpy.frombuffer(c, dtype='i') for c in (callers, callees, ref_types))
+        selected = ref_types == RefType.INHERITANCE.value
+        derived, bases = callers[selected], callees[selected]
+        labels = strong_labels(n, derived, bases)
+        derived, bases = labels[derived], labels[bases]
+        between = derived != bases
+        return longest_levels(int(labels.max()) + 1, derived[between], bases[between])[labels].tolist()
+    bases = [[] for _ in range(n)]
+    for c, b, t in zip(callers, callees, ref_types):
+        if t == RefType.INHERITANCE.value:
+            bases[c].append(b)
+    depth = [0] * n
+    for members in strong_components(n, bases):
+        cycle = set(members)
+        d = max((depth[b] + 1 for v in members for b in bases[v] if b not in cycle), default=0)
+        for v in members:
+            depth[v] = d
+    return depth
+
+
+def closure_sizes(n, callers, callees):
+    """
+    return the number of types each type depends on directly or transitively. reachable sets are bitsets over the
+    components of the graph, built from the components they reach and dropped once every component reaching them
+    is done
+    """
+    successors = [[] for _ in range(n)]
+    for c, d in zip(callers, callees):
+        successors[c].append(d)
+    components = strong_components(n, successors)
+    component_of = [0] * n
+    for k, members in enumerate(components):
+        for v in members:
+            component_of[v] = k
+    reached_by = [0] * len(components)
+    component_successors = []
+    for k, members in enumerate(components):
+        targets = {component_of[w] for v in members for w in successors[v]} - {k}
+        component_successors.append(targets)
+        for t in targets:
+            reached_by[t] += 1
+    reach = dict()
+    sizes = [0] * n
+    for k, members in enumerate(components):
+        bits = 0
+        for t in component_successors[k]:
+            bits |= reach[t]
+            reached_by[t] -= 1
+            if not reached_by[t]:
+                del reach[t]
+        size = bits.bit_count() + (len(members) - 1 if len(members) > 1 else 0)
+        for v in members:
+            sizes[v] = size
+            bits |= 1 << v
+        if reached_by[k]:
+            reach[k] = bits
+    return sizes
+
+
+def pagerank(n, callers, callees, damping=pagerank_damping, iterations=pagerank_iterations,
+             tolerance=pagerank_tolerance):
+    """
+    return the PageRank of each type, rank flowing from a type to the types it depends on, by power iteration until
+    the L1 change is below tolerance. the rank of types without dependency is spread over all types
+    """
+    if n == 0:
+        return []
+    if numpy is not None:
+        callers, callees = numpy.frombuffer(callers, dtype='i'), numpy.frombuffer(callees, dtype='i')
+        out_degree = numpy.bincount(callers, minlength=n).astype(float)
+        dangling = out_degree == 0
+        share = numpy.divide(1.0, out_degree, out=numpy.zeros(n), where=~dangling)
+        rank = numpy.full(n, 1.0 / n)
+        if connected_components is not None:
+            # row d of the sparse matrix sums the shares of the callers of d
+            incoming = csr_matrix((numpy.ones(len(callers)), (callees, callers)), shape=(n, n))
+            flow_of = incoming.dot
+        else:
+            def flow_of(shares):
+                return numpy.bincount(callees, weights=shares[callers], minlength=n)
+        for _ in range(iterations):
+            flow = flow_of(rank * share)
+            updated = (1 - damping) / n + damping * (flow + rank[dangling].sum() / n)
+            change = numpy.abs(updated - rank).sum()
+            rank = updated
+            if change < tolerance:
+                break
+        return rank.tolist()
+    out_degree = [0] * n
+    for c in callers:
+        out_degree[c] += 1
+    rank = [1.0 / n] * n
+    for _ in range(iterations):
+        spread = sum(r for r, d in zip(rank, out_degree) if d == 0) / n
+        updated = [(1 - damping) / n + damping * spread] * n
+        for c, d in zip(callers, callees):
+            updated[d] += damping * rank[c] / out_degree[c]
+        change = sum(abs(u - r) for u, r in zip(updated, rank))
+        rank = updated
+        if change < tolerance:
+            break
+    return rank
+
+
+def compute_metrics(nodes, edges, closure=False):
+    """
+    return the GraphMetrics of the types in nodes and in edges by name, sorted by name. closure sizes are exact and cost the
+    size of the closures, which can be most of a large graph for every type, so they are only computed if closure is
+    set
+    """
+    nodes, callers, callees, ref_types = edge_columns(nodes, edges)
+    n = len(nodes)
+    columns = fan_counts(n, callers, callees, ref_types)
+    columns['inheritance_depth'] = inheritance_depth(n, callers, callees, ref_types)
+    if closure:
+        columns['closure_size'] = closure_sizes(n, callers, callees)
+    columns['pagerank'] = pagerank(n, callers, callees)
+    return GraphMetrics(nodes, columns)
+
+
+def write_metrics(metrics, output_dir):
+    csv_file = os.path.join(output_dir, 'metrics.csv')
+    json_file = os.path.join(output_dir, 'metrics.json')
+    metrics.write_csv(csv_file)
+    metrics.write_json(json_file)
+    print(f'Saved metrics to {csv_file} and {json_file}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute per type metrics of the outputs of dependency_graph.py')
+    parser.add_argument('-o', '--output', default='.', help='Directory of the outputs of dependency_graph.py, where metrics.csv and metrics.json are written')
+    parser.add_argument('--closure-size', action='store_true', help='Also count the types each type depends on transitively, slow on large graphs')
+    args = parser.parse_args()
+    binary_file = os.path.join(args.output, 'graph.bin')
+    edge_file = os.path.join(args.output, 'edges.txt')
+    if os.path.exists(binary_file) and (not os.path.exists(edge_file)
+                                        or os.path.getmtime(binary_file) >= os.path.getmtime(edge_file)):
+        nodes, edges = load_binary(binary_file)
+    else:
+        nodes = load_nodes(os.path.join(args.output, 'nodes.txt'))
+        edges = iter_edge_nodes(nodes, edge_file)
+    edges = set(edges)
+    start = time.perf_counter()
+    metrics = compute_metrics(nodes.values(), edges, args.closure_size)
+    print(f'Computed the metrics of {len(metrics.nodes)} types in {time.perf_counter() - start:.3f}s')
+    write_metrics(metrics, args.output)
@@ -0,0 +1,57 @@
+import sys
+from collections import defaultdict
+
+directions = ['in', 'out', 'both']
+
+
+class Adjacency:
+    """
+    outgoing and incoming edges of every node, built once over an edge set
+    """
+    __slots__ = ('out_edges', 'in_edges')
+
+    def __init__(self, edges) -> None:
+        self.out_edges = defaultdict(list)
+        self.in_edges = defaultdict(list)
+        for e in edges:
+            self.out_edges[e.caller].append(e)
+            self.in_edges[e.callee].append(e)
+
+
+def find_focus(nodes, names):
+    """
+    return the nodes named by names, reporting the names that match no node
+    """
+    focus = {n for n in nodes if n.name in names}
+    missing = set(names) - {n.name for n in focus}
+    if missing:
+        print(f'Focus types not found: {sorted(missing)}', file=sys.stderr)
+    return focus
+
+
+def neighborhood(adjacency, focus, depth=1, direction='both'):
+    """
+    return (nodes, edges) of the subgraph induced by the nodes within depth hops of focus, following edges from caller
+    to callee for 'out', from callee to caller for 'in' or both ways.
+    a breadth first search taking time proportional to the subgraph and the degrees of its nodes
+    """
+    nodes = set(focus)
+    frontier = list(focus)
+    for _ in range(depth):
+        reached = []
+        for n in frontier:
+            neighbors = []
+            if direction != 'in':
+                neighbors += [e.callee for e in adjacency.out_edges.get(n, ())]
+            if direction != 'out':
+                neighbors += [e.caller for e in adjacency.in_edges.get(n, ())]
+            for m in neighbors:
+                if m not in nodes:
+                    nodes.add(m)
+                    reached.append(m)
+        if not reached:
+            break
+        frontier = reached
+    edges = [e for n in nodes for e in adjacency.out_edges.get(n, ()) if e.callee in nodes]
+    edges.sort(key=lambda e: (e.caller.name, e.callee.name, e.refType.value))
+    return nodes, edges
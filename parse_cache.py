@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+import sys
+
+from cpp_lexer import token_regex
+
+cache_file_name = '.parse_cache.pickle'
+include_state_file_name = '.include_state.pickle'
+cache_format = 4
+
+
+def cache_version():
+    """
+    a stamp of the parsing rules. any change to the regexes invalidates the cache
+    """
+    rules = [str(cache_format), token_regex]
+    return hashlib.sha1('\n'.join(rules).encode()).hexdigest()
+
+
+def file_digest(src_file):
+    with open(src_file, 'rb') as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+class ParseCache:
+    """
+    on-disk cache of src_proc results: {src_file: (size, mtime, digest, (nodeMap, includes, fwd_decls))}
+    a file whose size and mtime are unchanged is served without being opened,
+    a file whose stat changed but content did not is served after hashing it.
+    """
+
+    def __init__(self, cache_dir) -> None:
+        self.file = os.path.join(cache_dir, cache_file_name)
+        self.version = cache_version()
+        self.entries = dict()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file):
+            return
+        try:
+            with open(self.file, 'rb') as fd:
+                version, entries = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+            print(f'Ignoring unreadable parse cache {self.file}: {e}', file=sys.stderr)
+            return
+        if version == self.version:
+            self.entries = entries
+        else:
+            print(f'Parse cache {self.file} is stale and will be rebuilt')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file) or '.', exist_ok=True)
+        tmp_file = self.file + '.tmp'
+        with open(tmp_file, 'wb') as fd:
+            pickle.dump((self.version, self.entries), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.file)
+
+    def lookup(self, src_file):
+        """
+        return the cached (nodeMap, includes, fwd_decls) of src_file or None
+        """
+        entry = self.entries.get(src_file)
+        if entry is None:
+            self.misses += 1
+            return None
+        size, mtime, digest, result = entry
+        st = os.stat(src_file)
+        if st.st_size == size and st.st_mtime_ns == mtime:
+            self.hits += 1
+            return result
+        if st.st_size == size and file_digest(src_file) == digest:
+            self.entries[src_file] = (size, st.st_mtime_ns, digest, result)
+            self.hits += 1
+            return result
+        self.misses += 1
+        return None
+
+    def store(self, src_file, result):
+        st = os.stat(src_file)
+        self.entries[src_file] = (st.st_size, st.st_mtime_ns, file_digest(src_file), result)
+
+    def prune(self, src_files):
+        """
+        drop entries of files that no longer exist in the scanned trees
+        """
+        self.entries = {f: e for f, e in self.entries.items() if f in src_files}
+
+    def report(self):
+        print(f'Parse cache: {self.hits} hits, {self.misses} misses')
+
+
+def save_include_state(cache_dir, includes, headerToSrc):
+    """
+    persist the resolved includes {src: set(src)} and the header to source pairing of the last full or incremental
+    analysis, from which later incremental runs find the dependents of changed files
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    file = os.path.join(cache_dir, include_state_file_name)
+    with open(file + '.tmp', 'wb') as fd:
+        pickle.dump((cache_version(), includes, headerToSrc), fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file + '.tmp', file)
+
+
+def load_include_state(cache_dir):
+    """
+    return (includes, headerToSrc) saved by save_include_state, None if missing or stale
+    """
+    file = os.path.join(cache_dir, include_state_file_name)
+    if not os.path.exists(file):
+        return None
+    try:
+        with open(file, 'rb') as fd:
+            version, includes, headerToSrc = pickle.load(fd)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+        print(f'Ignoring unreadable include state {file}: {e}', file=sys.stderr)
+        return None
+    if version != cache_version():
+        return None
+    return includes, headerToSrc
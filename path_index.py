@@ -0,0 +1,33 @@
+import bisect
+import os
+import sys
+from collections import defaultdict
+
+
+class PathIndex:
+    """
+    index of file paths by basename.
+    resolving an include costs one dict lookup plus a suffix check on the few files sharing its basename
+    instead of a scan over all the files
+    """
+
+    def __init__(self, paths=()) -> None:
+        self.candidates = defaultdict(list)
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        bisect.insort(self.candidates[os.path.basename(path)], path)
+
+    def matches(self, incl):
+        """
+        return the sorted list of indexed paths ending with incl
+        """
+        return [p for p in self.candidates.get(os.path.basename(incl), ()) if p.endswith(incl)]
+
+    def best_match(self, incl):
+        matches = self.matches(incl)
+        if matches:
+            if len(matches) > 1:
+                print(f'More than one src files: {matches} matches {incl}', file=sys.stderr)
+            return matches[0]
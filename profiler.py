@@ -0,0 +1,120 @@
+import contextlib
+import heapq
+import json
+import time
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+default_top = 10
+
+# the profiler of the running analysis, None when profiling is off
+current = None
+
+
+class Profiler:
+    """
+    wall time of each analysis phase, summed worker time per parsed file, counters,
+    the slowest files and the largest class bodies.
+    phases may nest and are not additive: the walk is lazy and consumed while files are handed to the parsers, so
+    'walk' is the time spent waiting on the walk and is counted within 'parse' as well
+    """
+
+    def __init__(self, top=default_top) -> None:
+        self.top = top
+        self.phases = defaultdict(float)
+        self.worker_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.slowest_files = []
+        self.largest_bodies = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def timed(self, name, iterable):
+        """
+        generate the items of iterable, adding the time spent producing them to the phase name
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.phases[name] += time.perf_counter() - start
+            yield item
+
+    def keep(self, heap, item):
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def record_file(self, src_file, stats):
+        """
+        account the stats {'read': s, 'parse': s, 'bytes': n, 'bodies': {type: n}} a worker measured for src_file
+        """
+        self.counters['files_parsed'] += 1
+        self.counters['bytes_read'] += stats.get('bytes', 0)
+        seconds = 0.0
+        for step in ('read', 'parse'):
+            self.worker_seconds[step] += stats.get(step, 0.0)
+            seconds += stats.get(step, 0.0)
+        self.keep(self.slowest_files, (seconds, src_file, stats.get('bytes', 0)))
+        for name, size in stats.get('bodies', dict()).items():
+            self.counters['class_body_bytes'] += size
+            self.keep(self.largest_bodies, (size, name, src_file))
+
+    def report(self):
+        result = {
+            'phases': dict(self.phases),
+            'worker_seconds': dict(self.worker_seconds),
+            'counters': dict(self.counters),
+            'slowest_files': [{'file': f, 'seconds': s, 'bytes': b} for s, f, b in sorted(self.slowest_files, reverse=True)],
+            'largest_bodies': [{'type': n, 'file': f, 'bytes': b} for b, n, f in sorted(self.largest_bodies, reverse=True)],
+        }
+        if resource is not None:
+            # kilobytes on Linux, bytes on macOS
+            result['peak_rss'] = {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                                  'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+        return result
+
+    def save(self, file):
+        with open(file, 'w') as fd:
+            json.dump(self.report(), fd, indent=2)
+            fd.write('\n')
+        print(f'Saved profile to {file}')
+
+
+def enable(top=default_top):
+    global current
+    current = Profiler(top)
+    return current
+
+
+def disable():
+    global current
+    current = None
+
+
+def phase(name):
+    return current.phase(name) if current else contextlib.nullcontext()
+
+
+def timed(name, iterable):
+    return current.timed(name, iterable) if current else iterable
+
+
+def count(name, n=1):
+    if current:
+        current.counters[name] += n
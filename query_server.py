@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from data_structures import RefType
+from graph_io import encode
+from graph_query import load_index, run_query, query_kinds
+
+default_port = 8734
+poll_seconds = 1.0
+output_files = ['graph.bin', 'nodes.txt', 'edges.txt']
+
+
+class GraphService:
+    """
+    the GraphIndex of the outputs in output_dir, reloaded by a polling thread once the output files changed and stayed
+    unchanged for one more interval, so that a run still writing them is not read half way
+    """
+
+    def __init__(self, output_dir, interval=poll_seconds) -> None:
+        self.output_dir = output_dir
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+        self.index = load_index(output_dir)
+        self.loaded = time.time()
+        self.generation = 1
+        self.stopped = threading.Event()
+        self.poller = threading.Thread(target=self.poll, name='graph-reload', daemon=True)
+
+    def take_snapshot(self):
+        snapshot = dict()
+        for f in output_files:
+            try:
+                st = os.stat(os.path.join(self.output_dir, f))
+            except OSError:
+                continue
+            snapshot[f] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def poll(self):
+        previous = self.snapshot
+        while not self.stopped.wait(self.interval):
+            snapshot = self.take_snapshot()
+            if snapshot != self.snapshot and snapshot == previous:
+                self.reload(snapshot)
+            previous = snapshot
+
+    def reload(self, snapshot):
+        start = time.monotonic()
+        try:
+            index = load_index(self.output_dir)
+        except (OSError, ValueError, KeyError) as e:
+            # left for the next change of the files
+            print(f'Cannot reload the graph in {self.output_dir}: {e!r}', file=sys.stderr)
+            self.snapshot = snapshot
+            return
+        # requests in flight keep the index they started with
+        self.index = index
+        self.snapshot = snapshot
+        self.loaded = time.time()
+        self.generation += 1
+        print(f'Reloaded {len(index.names)} types and {index.edge_count} edges in {time.monotonic() - start:.3f}s')
+
+    def start(self):
+        self.poller.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def query(self, kind, params):
+        """
+        return (HTTP status, response dict) of the query kind with the query string params {name: [values]}
+        """
+        index = self.index
+        if kind == 'stats':
+            return 200, {'types': len(index.names), 'edges': index.edge_count, 'loaded': self.loaded,
+                         'generation': self.generation}
+        if kind not in query_kinds:
+            return 404, {'error': f'unknown query {kind}, expected one of {query_kinds + ["stats"]}'}
+        try:
+            ref_types = frozenset(RefType[t.upper()] for t in params.get('ref_type', ()))
+        except KeyError as e:
+            return 400, {'error': f'unknown ref_type {e}'}
+        arguments = ['source', 'target'] if kind == 'path' else ['type']
+        missing = [a for a in arguments if a not in params]
+        if missing:
+            return 400, {'error': f'missing parameters {missing}'}
+        names = [params[a][0] for a in arguments]
+        unknown = [n for n in names if n not in index.ids]
+        if unknown:
+            return 404, {'error': f'types not found: {unknown}'}
+        transitive = params.get('transitive', ['0'])[0] not in ('0', 'false', '')
+        result = run_query(index, kind, names, ref_types, transitive)
+        response = dict(zip(arguments, names))
+        response[kind] = None if result is None else list(result)
+        return 200, response
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # keeps connections alive between requests, the body is sent right behind the headers instead of waiting for
+    # their delayed acknowledgement
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            status, response = self.server.service.query(url.path.strip('/'), parse_qs(url.query))
+        except (KeyError, ValueError) as e:
+            # answered instead of dropping the connection with the exception
+            status, response = 400, {'error': f'malformed query: {e!r}'}
+        body = encode(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service, host='127.0.0.1', port=default_port):
+    """
+    return a threading HTTP server answering the queries of service, port 0 picking a free port
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve dependency queries over the outputs of dependency_graph.py as JSON')
+    parser.add_argument('-o', '--output', default='.', help='Directory of the outputs of dependency_graph.py')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=default_port, help='Port to listen on')
+    parser.add_argument('--reload-interval', type=float, default=poll_seconds, help='Seconds between checks of the output files for changes')
+    args = parser.parse_args()
+    service = GraphService(args.output, args.reload_interval)
+    service.start()
+    server = create_server(service, args.host, args.port)
+    print(f'Serving {len(service.index.names)} types and {service.index.edge_count} edges on '
+          f'http://{args.host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import sys
+from collections import defaultdict
+
+from data_structures import SourceNode, SymbolNode, CodeNode, EdgeNode, RefType, TypeClassifier
+from dependency_gen import (iter_parsed, walk_code_files, identify_symbol_src, find_edges, max_workers,
+                            default_excludes)
+
+db_file_name = 'graph.sqlite'
+
+schema = '''
+CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE);
+CREATE TABLE symbols (id INTEGER PRIMARY KEY, name TEXT NOT NULL, classifier TEXT NOT NULL,
+                      file_id INTEGER NOT NULL REFERENCES files(id));
+CREATE INDEX symbols_file ON symbols(file_id);
+CREATE INDEX symbols_name ON symbols(name);
+CREATE TABLE summaries (symbol_id INTEGER PRIMARY KEY REFERENCES symbols(id), field_names TEXT NOT NULL,
+                        method_names TEXT NOT NULL, inheritance_names TEXT NOT NULL);
+CREATE TABLE includes (file_id INTEGER NOT NULL REFERENCES files(id), include TEXT NOT NULL);
+CREATE INDEX includes_file ON includes(file_id);
+CREATE TABLE fwd_declares (file_id INTEGER NOT NULL REFERENCES files(id), name TEXT NOT NULL,
+                           classifier TEXT NOT NULL);
+CREATE INDEX fwd_declares_file ON fwd_declares(file_id);
+CREATE TABLE resolved_includes (file_id INTEGER NOT NULL, included_id INTEGER NOT NULL,
+                                PRIMARY KEY (file_id, included_id)) WITHOUT ROWID;
+CREATE INDEX resolved_includes_included ON resolved_includes(included_id);
+CREATE TABLE edges (caller_id INTEGER NOT NULL, callee_id INTEGER NOT NULL, ref_type TEXT NOT NULL,
+                    PRIMARY KEY (caller_id, callee_id, ref_type)) WITHOUT ROWID;
+CREATE INDEX edges_callee ON edges(callee_id);
+'''
+
+
+class StoredRows:
+    """
+    re-iterable view of the nodes or edges of a store, read from the database again on every iteration
+    """
+
+    def __init__(self, db, rows, table) -> None:
+        self.db = db
+        self.rows = rows
+        self.table = table
+
+    def __iter__(self):
+        return self.rows()
+
+    def __len__(self):
+        return self.db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+
+class SqliteGraphStore:
+    """
+    parse results, symbol table and edges of an analysis spilled into a SQLite database.
+    type summaries stay on disk and are loaded one file at a time during edge extraction.
+    """
+
+    def __init__(self, db_path, reset=False) -> None:
+        if reset and os.path.exists(db_path):
+            os.remove(db_path)
+        exists = os.path.exists(db_path)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA synchronous = OFF')
+        if not exists:
+            self.db.executescript(schema)
+        self.file_ids = dict()
+        self.symbol_ids = dict()
+        self.nodes_by_id = None
+        self.nodes = StoredRows(self.db, self.iter_nodes, 'symbols')
+        self.edges = StoredRows(self.db, self.iter_edges, 'edges')
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def add_file(self, src_file, ns, incls, fwd_decs):
+        if not (ns or incls or fwd_decs):
+            return
+        file_id = self.db.execute('INSERT INTO files (path) VALUES (?)', (src_file,)).lastrowid
+        for symbol, code in ns.items():
+            symbol_id = self.db.execute('INSERT INTO symbols (name, classifier, file_id) VALUES (?, ?, ?)',
+                                        (symbol.name, symbol.classifier.name, file_id)).lastrowid
+            self.db.execute('INSERT INTO summaries VALUES (?, ?, ?, ?)',
+                            (symbol_id, ' '.join(code.field_names), ' '.join(code.method_names),
+                             ' '.join(code.inheritance_names)))
+        self.db.executemany('INSERT INTO includes VALUES (?, ?)', [(file_id, i.srcFile) for i in incls])
+        self.db.executemany('INSERT INTO fwd_declares VALUES (?, ?, ?)',
+                            [(file_id, f.name, f.classifier.name) for f in fwd_decs])
+
+    def load_structure(self):
+        """
+        return a tuple (includes, declares, fwd_declares) shaped like source_proc's but without type summaries,
+        declares being {src: {SymbolNode: None}}
+        """
+        sources = dict()
+        for file_id, path in self.db.execute('SELECT id, path FROM files ORDER BY path'):
+            sources[file_id] = SourceNode(path)
+            self.file_ids[sources[file_id]] = file_id
+        declares = {src: dict() for src in sources.values()}
+        for symbol_id, name, classifier, file_id in self.db.execute('SELECT id, name, classifier, file_id FROM symbols'):
+            symbol = SymbolNode(name, TypeClassifier[classifier], sources[file_id])
+            declares[symbol.source][symbol] = None
+            self.symbol_ids[symbol] = symbol_id
+        includes = defaultdict(set)
+        for file_id, include in self.db.execute('SELECT file_id, include FROM includes'):
+            includes[sources[file_id]].add(SourceNode(include))
+        fwd_declares = defaultdict(set)
+        for file_id, name, classifier in self.db.execute('SELECT file_id, name, classifier FROM fwd_declares'):
+            fwd_declares[sources[file_id]].add(SymbolNode(name, TypeClassifier[classifier], None))
+        declares = {src: types for src, types in declares.items() if types}
+        return dict(includes), declares, dict(fwd_declares)
+
+    def save_resolved_includes(self, includes):
+        self.db.executemany('INSERT INTO resolved_includes VALUES (?, ?)',
+                            [(self.file_ids[src], self.file_ids[i]) for src, incls in includes.items() for i in incls])
+
+    def file_declares(self, src):
+        """
+        return {SymbolNode: CodeNode} of the types declared in src, summaries included
+        """
+        result = dict()
+        query = '''SELECT s.name, s.classifier, m.field_names, m.method_names, m.inheritance_names
+                   FROM symbols s JOIN summaries m ON m.symbol_id = s.id WHERE s.file_id = ?'''
+        for name, classifier, fields, methods, inheritance in self.db.execute(query, (self.file_ids[src],)):
+            symbol = SymbolNode(name, TypeClassifier[classifier], src)
+            result[symbol] = CodeNode(fields.split(), methods.split(), inheritance.split())
+        return result
+
+    def add_edges(self, edges):
+        self.db.executemany('INSERT OR IGNORE INTO edges VALUES (?, ?, ?)',
+                            [(self.symbol_ids[e.caller], self.symbol_ids[e.callee], e.refType.name) for e in edges])
+
+    def symbol_nodes(self):
+        """
+        return {symbol id: SymbolNode}, loaded once and shared by every iteration over the nodes and edges, the types
+        being far fewer than the edges
+        """
+        if self.nodes_by_id is None:
+            query = '''SELECT s.id, s.name, s.classifier, f.path FROM symbols s JOIN files f ON f.id = s.file_id'''
+            sources = dict()
+            self.nodes_by_id = dict()
+            for symbol_id, name, classifier, path in self.db.execute(query):
+                source = sources.get(path)
+                if source is None:
+                    source = sources[path] = SourceNode(path)
+                self.nodes_by_id[symbol_id] = SymbolNode(name, TypeClassifier[classifier], source)
+        return self.nodes_by_id
+
+    def iter_nodes(self):
+        # types declared twice in a file are one node, as in the in-memory analysis
+        return iter(dict.fromkeys(self.symbol_nodes()[i] for i in sorted(self.symbol_nodes())))
+
+    def iter_edges(self):
+        nodes = self.symbol_nodes()
+        query = 'SELECT caller_id, callee_id, ref_type FROM edges ORDER BY caller_id, callee_id, ref_type'
+        for caller_id, callee_id, ref_type in self.db.execute(query):
+            yield EdgeNode(nodes[caller_id], nodes[callee_id], RefType[ref_type])
+
+    def verify(self):
+        """
+        verify_data over the database: every edge joins two stored types, the unreferenced types are reported
+        """
+        dangling = self.db.execute('''SELECT COUNT(*) FROM edges e
+                                     WHERE NOT EXISTS (SELECT 1 FROM symbols WHERE id = e.caller_id)
+                                     OR NOT EXISTS (SELECT 1 FROM symbols WHERE id = e.callee_id)''').fetchone()[0]
+        assert not dangling, f'{dangling} edges refer to types not found'
+        unreferenced = [name for name, in self.db.execute('''SELECT name FROM symbols s
+                        WHERE NOT EXISTS (SELECT 1 FROM edges WHERE caller_id = s.id)
+                        AND NOT EXISTS (SELECT 1 FROM edges WHERE callee_id = s.id) ORDER BY name''')]
+        if unreferenced:
+            print(f'Unreferenced types: {unreferenced}', file=sys.stderr)
+        print('Data verified and no anomaly found')
+
+
+def sqlite_analysis(folders, db_path, jobs=max_workers, executor='process', reader='text',
+                    excludes=default_excludes, use_gitignore=True):
+    """
+    same as dep_analysis, with the parse results spilled into the SQLite database at db_path as they arrive and the
+    type summaries read back one file at a time, so that memory is bounded by the largest file instead of the tree.
+    return the open store, whose nodes and edges are streamed from the database, to be closed by the caller.
+    the database is kept as an output, load_graph reads it back
+    """
+    store = SqliteGraphStore(db_path, reset=True)
+    for record in iter_parsed(walk_code_files(folders, excludes, use_gitignore), jobs, executor, reader):
+        store.add_file(*record)
+    store.db.commit()
+
+    includes, declares, fwd_declares = store.load_structure()
+    identify_symbol_src(includes, declares, fwd_declares)
+    store.save_resolved_includes(includes)
+    for src in sorted(declares.keys()):
+        symbols = declares[src]
+        declares[src] = store.file_declares(src)
+        store.add_edges(find_edges(declares, includes, fwd_declares, {src}))
+        declares[src] = symbols
+    store.db.commit()
+    return store
+
+
+def load_graph(db_path):
+    """
+    return (nodes, edges) stored in the database as {name: SymbolNode} and set(EdgeNode)
+    """
+    store = SqliteGraphStore(db_path)
+    nodes = {n.name: n for n in store.nodes}
+    edges = set(store.edges)
+    store.close()
+    return nodes, edges
@@ -1,108 +1,125 @@
 import argparse
-import codecs
+import mmap
 import os
-import queue
 import re
 import sys
+import time
 
-from data_structures import SourceNode, TypeClassifier, SourceType, SymbolNode, CodeNode
+from cpp_lexer import scan
+from data_structures import SourceNode, SymbolNode, CodeNode
 
-max_queue_size = 7
-assembly_line = queue.Queue(max_queue_size)
+prefilter_pattern = re.compile(rb'class|struct|enum|#\s*include')
+readers = ['text', 'mmap']
 
-include_regex = re.compile('#include\s+["<"](.*)[">]')
-valid_headers = [['.h', '.hpp'], 'red']
-valid_sources = [['.c', '.cc', '.cpp'], 'blue']
-valid_extensions = valid_headers[0] + valid_sources[0]
+identifier_pattern = re.compile(r'\w+')
+statement_token_pattern = re.compile(r'\w+|[;()]')
 
-fwd_decl_regex = r'(?<!friend)\s+(class|struct|enum(?: class)?) +([_a-zA-Z][_a-zA-Z0-9]*)\s*;'
-fwd_decl_pattern = re.compile(fwd_decl_regex)
-type_declare_regex = r'(class|struct|enum(?: class)?) +([_a-zA-Z][_a-zA-Z0-9]*)\s*(:[^\{]+)?\{'
-type_declare_pattern = re.compile(type_declare_regex)
 
-template_regex = r'template\s*<[^>]*>'
-template_pattern = re.compile(template_regex)
-
-
-def search_type_declares(code, src_file):
+def summarize(class_body, inheritance_declare=None):
     """
-    return dictionary: {Node: code} denoting all the types defined in the src file
+    reduce a class body to the identifiers of its statements, split by whether the statement contains parentheses,
+    and an inheritance clause to its identifiers
     """
-    srcNode = SourceNode(src_file)
-    if srcNode.sourceType is None:
-        print(f'Source file {src_file} do not have a valid extension', file=sys.stderr)
-    result = dict()
-    declare_blocks = re.finditer(type_declare_pattern, code)
-    for block in declare_blocks:
-        t, n, d = block.groups()
-        if not n:
-            print(f'Source file {block} contains invalid type declaration', file=sys.stderr)
-
-        symbol = SymbolNode(n, t, srcNode)
-        classBody = parse_class_body(code[block.end():])
-        assert classBody, f'{symbol} has no body'
-        result[symbol] = CodeNode(class_body=classBody, inheritance_declare=d or None)
-    return result
-
-
-def parse_class_body(code):
-    bracket_balance = 1
-    class_end = -1
-    for i, c in enumerate(code):
-        if c == '{':
-            bracket_balance += 1
-        elif c == '}':
-            bracket_balance -= 1
-        if bracket_balance == 0:
-            class_end = i + 1
-            break
-    return code[:class_end].strip()
-
-
-def strip(line):
-    i = line.find('//')
-    return line[:i].strip()
-
-
-def remove_templates(code):
-    """
-    code such as template<int w, std::size_t n, class SeedSeq, class IntType> poses problem for detecting tpes
-    as preprocessing, we will remove them
-    """
-    return re.sub(template_pattern, '', code)
-
-
-def src_proc(src_file):
+    fields = set()
+    methods = set()
+    names = []
+    is_method = False
+    for token in statement_token_pattern.findall(class_body + ';'):
+        if token == ';':
+            (methods if is_method else fields).update(names)
+            names = []
+            is_method = False
+        elif token == '(' or token == ')':
+            is_method = True
+        else:
+            names.append(token)
+    inheritance = identifier_pattern.findall(inheritance_declare) if inheritance_declare else ()
+    return CodeNode(map(sys.intern, fields), map(sys.intern, methods), map(sys.intern, inheritance))
+
+
+def src_proc(src_file, reader='text', stats=None):
     """
     return a tuple of
      dictionary: {Node: code} denoting all the types defined in the src file
      includes: list of header files included in the src file
      fwd_decls: set of forward declarations
+    reader: 'text' decodes the whole file before scanning, 'mmap' scans the mapped bytes and decodes only what is kept
+    stats: if given, a dict receiving the read and parse seconds, the file size and the class body sizes
     """
-    with codecs.open(src_file, 'r', "utf-8", "ignore") as fd:
-        code_lines = [strip(l) for l in fd.readlines()]
-        code = '\n'.join([l for l in code_lines if l])
-        code = remove_templates(code)
-        includes = set()
-        fwd_decs = set()
-        for header in include_regex.findall(code):
-            hf = os.path.basename(header)
-            src, ext = os.path.splitext(hf)
-            if ext:
-                includes.add(SourceNode(hf))
-        for fd in fwd_decl_pattern.findall(code):
-            fwd_decs.add(SymbolNode(fd[1], fd[0], None))
-        nodeMap = search_type_declares(code, src_file)
-        return nodeMap, includes, fwd_decs
+    if reader == 'mmap':
+        return mapped_src_proc(src_file, stats)
+    start = time.perf_counter()
+    with open(src_file, 'r', encoding='utf-8', errors='ignore') as fd:
+        code = fd.read()
+    if stats is None:
+        return collect_declares(src_file, *scan(code))
+    read = time.perf_counter()
+    result = collect_declares(src_file, *scan(code), body_sizes=stats.setdefault('bodies', dict()))
+    stats.update(read=read - start, parse=time.perf_counter() - read, bytes=len(code))
+    return result
+
+
+def mapped_src_proc(src_file, stats=None):
+    start = time.perf_counter()
+    with open(src_file, 'rb') as fd:
+        size = os.fstat(fd.fileno()).st_size
+        if stats is not None:
+            stats['bytes'] = size
+        if size == 0:
+            return dict(), set(), set()
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as code:
+            # files without any type declaration or include need no further work
+            found = prefilter_pattern.search(code)
+            # pages are faulted in by the prefilter, which is accounted as reading
+            read = time.perf_counter()
+            if stats is not None:
+                stats['read'] = read - start
+            if not found:
+                return dict(), set(), set()
+            bodies = None if stats is None else stats.setdefault('bodies', dict())
+            result = collect_declares(src_file, *scan(code), decode=decode, body_sizes=bodies)
+            if stats is not None:
+                stats['parse'] = time.perf_counter() - read
+            return result
+
+
+def decode(b):
+    return b.decode('utf-8', 'ignore')
+
+
+def collect_declares(src_file, code, headers, fwd_decls, declares, decode=str, body_sizes=None):
+    includes = set()
+    fwd_decs = set()
+    for header in headers:
+        hf = os.path.basename(decode(header))
+        src, ext = os.path.splitext(hf)
+        if ext:
+            includes.add(SourceNode(hf))
+    for t, n in fwd_decls:
+        fwd_decs.add(SymbolNode(decode(n), decode(t), None))
+    nodeMap = dict()
+    srcNode = SourceNode(src_file)
+    if srcNode.sourceType is None:
+        print(f'Source file {src_file} do not have a valid extension', file=sys.stderr)
+    for declare in declares:
+        symbol = SymbolNode(decode(declare.name), decode(declare.classifier), srcNode)
+        classBody = decode(code[declare.body_start:declare.body_end]).strip()
+        assert classBody, f'{symbol} has no body'
+        if body_sizes is not None:
+            body_sizes[symbol.name] = len(classBody)
+        d = declare.inheritance_declare
+        nodeMap[symbol] = summarize(classBody, decode(d) if d else None)
+    return nodeMap, includes, fwd_decs
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('src_dirs', metavar='source_directories', help='Path to the folder(s) to scan for src')
+    parser.add_argument('--reader', choices=readers, default='text', help='How source files are read')
     args = parser.parse_args()
     src_file = args.src_dirs
-    nodeMap, includes, fwd_decs = src_proc(src_file)
-    printable_types = {n: ('with inheritance' if c.inheritance_declare is not None else 'no inheritance', 'with body' if c.class_body else 'no body') for n, c in nodeMap.items()}
+    nodeMap, includes, fwd_decs = src_proc(src_file, args.reader)
+    printable_types = {n: ('with inheritance' if c.inheritance_names else 'no inheritance', 'with body' if c.field_names or c.method_names else 'no body') for n, c in nodeMap.items()}
     print(f'Found declared types: {printable_types}')
     print(f'Included headers: {includes}')
     print(f'Forward declares: {fwd_decs}')
@@ -0,0 +1,55 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from data_structures import SourceNode, SymbolNode, EdgeNode, RefType, TypeClassifier
+
+try:
+    import dependency_vis
+except ImportError:
+    # the drawing dependencies of requirements.txt are not installed
+    dependency_vis = None
+
+
+@unittest.skipIf(dependency_vis is None, 'the requirements of dependency_vis.py are not installed')
+class ClusteredGraphTest(unittest.TestCase):
+    """
+    the drill-down graphs of a graph larger than large_threshold size their types by the weights given to
+    create_graphviz, like a graph drawn at once
+    """
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        types = [SymbolNode(f'T{i}', TypeClassifier.CLASS, SourceNode(f'dir_{i % 2}/t{i}.h')) for i in range(6)]
+        self.edges = {EdgeNode(types[i], types[i - 1], RefType.COMPOSITION) for i in range(1, 6)}
+        self.weights = {f'T{i}': float(i) for i in range(6)}
+        self.drawn = dict()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def render(self, graph, output_file, formats, cache_dir=None):
+        self.drawn[os.path.basename(output_file)] = graph.source
+        return [f'{output_file}.{f}' for f in formats]
+
+    def node_widths(self, source):
+        return {m.group(1): float(m.group(2)) for m in re.finditer(r'^\s*(T\d+) \[.*?width=([\d.]+)', source, re.M)}
+
+    def test_drill_downs_sized_by_weights(self):
+        with mock.patch.object(dependency_vis, 'render', self.render):
+            dependency_vis.create_graphviz(self.edges, os.path.join(self.output, 'graph'), formats=['svg'],
+                                           large_threshold=1, weights=self.weights)
+        drill_downs = {name: source for name, source in self.drawn.items() if name != 'graph'}
+        self.assertEqual(len(drill_downs), 2)
+        for source in drill_downs.values():
+            widths = self.node_widths(source)
+            self.assertTrue(widths)
+            biggest = max(self.weights[n] for n in widths)
+            self.assertEqual(widths, {n: round(self.weights[n] / biggest, 3) for n in widths})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import contextlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import unittest
+from collections import Counter
+
+from corpus_gen import generate
+from dependency_gen import dep_analysis, write_nodes, write_edges
+from incremental import incremental_analysis
+
+
+def git(directory, *args):
+    subprocess.run(['git', '-C', directory, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+                   check=True, capture_output=True)
+
+
+class IncrementalAnalysisTest(unittest.TestCase):
+    """
+    --since patches the outputs of a full run after changes committed to a git repo, the patched nodes.txt and
+    edges.txt must equal the ones of a full run on the changed tree
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.output = os.path.join(self.root, 'output')
+        generate(self.src, files=80, depth=4, fanout=2, classes=2, members=6, seed=7)
+        git(self.src, 'init', '-q')
+        git(self.src, 'add', '-A')
+        git(self.src, 'commit', '-q', '-m', 'base')
+        os.makedirs(self.output)
+        nodes, edges = self.quietly(dep_analysis, [self.src], 1, 'serial', self.output)
+        self.write(self.output, nodes, edges)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def quietly(self, function, *args):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return function(*args)
+
+    def write(self, output, nodes, edges):
+        self.quietly(write_nodes, nodes, os.path.join(output, 'nodes.txt'))
+        self.quietly(write_edges, edges, os.path.join(output, 'edges.txt'))
+
+    def path(self, name):
+        return os.path.join(self.src, name)
+
+    def most_included_header(self):
+        counts = Counter()
+        for directory, _, files in os.walk(self.src):
+            for f in files:
+                if f.endswith('.h'):
+                    with open(os.path.join(directory, f)) as fd:
+                        counts.update(re.findall(r'#include "(dir_\d+/m\d+\.h)"', fd.read()))
+        return counts.most_common(1)[0][0]
+
+    def edit(self, name, old, new):
+        with open(self.path(name)) as fd:
+            text = fd.read()
+        self.assertIn(old, text)
+        with open(self.path(name), 'w') as fd:
+            fd.write(text.replace(old, new))
+
+    def assert_patched_equals_full(self):
+        git(self.src, 'add', '-A')
+        git(self.src, 'commit', '-q', '-m', 'change')
+        nodes, edges = self.quietly(incremental_analysis, [self.src], 'HEAD~1', self.output,
+                                    os.path.join(self.output, 'nodes.txt'), os.path.join(self.output, 'edges.txt'),
+                                    1, 'serial')
+        self.write(self.output, nodes, edges)
+        full = os.path.join(self.root, 'full')
+        os.makedirs(full)
+        self.write(full, *self.quietly(dep_analysis, [self.src], 1, 'serial', None))
+        for name in ('nodes.txt', 'edges.txt'):
+            with open(os.path.join(self.output, name)) as patched, open(os.path.join(full, name)) as expected:
+                self.assertEqual(sorted(patched), sorted(expected), name)
+
+    def test_leaf_source_edit(self):
+        self.edit('dir_0/m3.cpp', '}  // namespace bench', 'struct Added {\n    C3_0 field;\n};\n\n}  // namespace bench')
+        self.assert_patched_equals_full()
+
+    def test_header_edit_changes_dependents(self):
+        header = self.most_included_header()
+        i = re.search(r'm(\d+)\.h', header).group(1)
+        self.edit(header, f'class C{i}_0', f'class Renamed{i}_0')
+        self.assert_patched_equals_full()
+
+    def test_added_file(self):
+        header = self.most_included_header()
+        i = re.search(r'm(\d+)\.h', header).group(1)
+        with open(self.path('dir_0/added.h'), 'w') as fd:
+            fd.write(f'#include "{header}"\n\nclass Added : public C{i}_1 {{\n    C{i}_0 field;\n}};\n')
+        self.assert_patched_equals_full()
+
+    def test_deleted_file(self):
+        os.remove(self.path(self.most_included_header()))
+        self.assert_patched_equals_full()
+
+    def test_renamed_file(self):
+        git(self.src, 'mv', 'dir_0/m3.cpp', 'dir_0/renamed.cpp')
+        git(self.src, 'mv', self.most_included_header(), 'dir_0/renamed.h')
+        self.assert_patched_equals_full()
+
+    def test_all_changes_at_once(self):
+        header = self.most_included_header()
+        i = re.search(r'm(\d+)\.h', header).group(1)
+        self.edit('dir_0/m3.cpp', '}  // namespace bench', 'struct Added {\n    C3_0 field;\n};\n\n}  // namespace bench')
+        self.edit(header, f'class C{i}_0', f'class Renamed{i}_0')
+        with open(self.path('dir_0/added.h'), 'w') as fd:
+            fd.write(f'#include "{header}"\n\nclass Added2 : public Renamed{i}_0 {{\n}};\n')
+        os.remove(self.path('dir_0/m5.h'))
+        self.assert_patched_equals_full()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from dependency_gen import collect_sources, parse_sources, walk_code_files, has_valid_extension, max_workers, \
+    default_excludes
+from file_walker import IgnoreRules, always_skipped, read_gitignore, scan_dir
+from incremental import reanalyze
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+event_header = struct.Struct('iIII')
+
+debounce_seconds = 0.2
+poll_seconds = 1.0
+
+
+class PollingWatcher:
+    """
+    detects changed code files by comparing the size and mtime of every walked file
+    """
+
+    def __init__(self, folders, excludes, use_gitignore, interval=poll_seconds) -> None:
+        self.folders = folders
+        self.excludes = excludes
+        self.use_gitignore = use_gitignore
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = dict()
+        for f in walk_code_files(self.folders, self.excludes, self.use_gitignore):
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            snapshot[f] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """
+        return the set of files created, modified or deleted within timeout seconds, wait forever if timeout is None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval, deadline - time.monotonic())))
+            snapshot = self.take_snapshot()
+            changed = {f for f in snapshot.keys() | self.snapshot.keys() if snapshot.get(f) != self.snapshot.get(f)}
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    detects changed code files through Linux inotify, one watch per directory. the directories and files are filtered
+    with the same exclude and .gitignore rules as the walk of the analysis
+    """
+
+    def __init__(self, folders, excludes, use_gitignore) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.folders = folders
+        self.excludes = excludes
+        self.use_gitignore = use_gitignore
+        self.dirs = dict()
+        # the code files under the watched directories, reported as deleted when their directory goes away
+        self.files = set()
+        for folder in folders:
+            self.add_tree(folder, IgnoreRules().extend(folder.rstrip(os.sep), excludes))
+
+    def add_tree(self, directory, rules):
+        """
+        watch directory and its subdirectories that are not ignored by rules and their .gitignore files, return the
+        code files found in them
+        """
+        files = set()
+        pending = [(directory, rules)]
+        while pending:
+            dirpath, rules = pending.pop()
+            if self.use_gitignore:
+                rules = rules.extend(dirpath, read_gitignore(dirpath))
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), watch_mask)
+            if wd < 0:
+                print(f'Cannot watch {dirpath}: {os.strerror(ctypes.get_errno())}', file=sys.stderr)
+                continue
+            # the rules of a directory apply to the events of its entries
+            self.dirs[wd] = (dirpath, rules)
+            found, subdirs = scan_dir(dirpath, rules, has_valid_extension, False)
+            files.update(found)
+            pending += subdirs
+        self.files |= files
+        return files
+
+    def remove_tree(self, directory):
+        """
+        stop watching directory and its subdirectories, deleted or moved away, return the code files known under them
+        """
+        prefix = directory + os.sep
+        for wd, (dirpath, _) in list(self.dirs.items()):
+            if dirpath == directory or dirpath.startswith(prefix):
+                del self.dirs[wd]
+                # fails harmlessly for a deleted directory, its watch is already gone
+                self.libc.inotify_rm_watch(self.fd, wd)
+        files = {f for f in self.files if f.startswith(prefix)}
+        self.files -= files
+        return files
+
+    def accept(self, path, rules, is_dir=False):
+        name = os.path.basename(path)
+        if name in always_skipped or rules.ignored(path, name, is_dir):
+            return False
+        return is_dir or has_valid_extension(path)
+
+    def wait(self, timeout=None):
+        """
+        return the set of files created, modified or deleted within timeout seconds, wait forever if timeout is None
+        """
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = event_header.unpack_from(data, offset)
+                name = data[offset + event_header.size:offset + event_header.size + length].rstrip(b'\0')
+                offset += event_header.size + length
+                if wd not in self.dirs:
+                    continue
+                dirpath, rules = self.dirs[wd]
+                if mask & IN_IGNORED:
+                    del self.dirs[wd]
+                    continue
+                path = os.path.join(dirpath, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and self.accept(path, rules, is_dir=True):
+                        changed |= self.add_tree(path, rules)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        changed |= self.remove_tree(path)
+                elif name and self.accept(path, rules):
+                    changed.add(path)
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        self.files.discard(path)
+                    else:
+                        self.files.add(path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(folders, excludes, use_gitignore):
+    if sys.platform.startswith('linux') and all(os.path.isdir(f) for f in folders):
+        try:
+            return InotifyWatcher(folders, excludes, use_gitignore)
+        except (OSError, AttributeError, TypeError) as e:
+            print(f'inotify is not available, falling back to polling: {e}', file=sys.stderr)
+    return PollingWatcher(folders, excludes, use_gitignore)
+
+
+def watch(folders, on_update, jobs=max_workers, executor='process', cache_dir=None, reader='text',
+          excludes=default_excludes, use_gitignore=True, debounce=debounce_seconds):
+    """
+    keep the parse results of folders in memory and call on_update(nodes, edges) after the initial analysis and after
+    every burst of file changes, once no further change arrived for debounce seconds.
+    only the changed files are re-parsed and only their dependents are re-analyzed. an update that fails, e.g. on a
+    half saved file, is reported and tried again with the next change.
+    """
+    watcher = create_watcher(folders, excludes, use_gitignore)
+    results = collect_sources(folders, jobs, executor, cache_dir, reader, excludes, use_gitignore)
+    nodes, edges, includes, headerToSrc = reanalyze(results, set(results.keys()), dict(), dict(), [])
+    on_update(nodes, edges)
+    print(f'Watching {folders} with {type(watcher).__name__}')
+    pending = set()
+    failed = False
+    try:
+        while True:
+            # after a failed update, e.g. a half saved file, wait for the next change before trying again
+            changed = watcher.wait(debounce if pending and not failed else None)
+            if changed:
+                pending |= changed
+                failed = False
+                continue
+            if not pending:
+                continue
+            start = time.monotonic()
+            try:
+                existing = sorted(f for f in pending if os.path.isfile(f))
+                # a pool costs more to start than a handful of files cost to parse
+                parsed = parse_sources(existing, jobs, executor if len(existing) > jobs else 'serial', reader)
+                for f in pending:
+                    results.pop(f, None)
+                results.update(parsed)
+                nodes, edges, includes, headerToSrc = reanalyze(results, pending, includes, headerToSrc, edges)
+                on_update(nodes, edges)
+            except Exception as e:
+                print(f'Cannot update {len(pending)} changed files, waiting for the next change: {e!r}',
+                      file=sys.stderr)
+                failed = True
+                continue
+            print(f'Updated {len(pending)} changed files in {time.monotonic() - start:.3f}s')
+            pending = set()
+    finally:
+        watcher.close()